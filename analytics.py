@@ -0,0 +1,336 @@
+# file: analytics.py
+
+import os
+import warnings
+from contextlib import contextmanager
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# trading days in a year, to annualize the sharpe-like ratio
+YEAR_DAYS = 252
+
+RANK_DTYPE = np.dtype([('fundId', 'i4'), ('n', 'i4'),
+                       ('mean', 'f8'), ('stdev', 'f8'),
+                       ('mean_return', 'f8'), ('stdev_return', 'f8'),
+                       ('cum_return', 'f8'), ('max_drawdown', 'f8'),
+                       ('sharpe', 'f8'),
+                       ('roll_mean', 'f8'), ('roll_stdev', 'f8'),
+                       ('roll_return', 'f8'), ('roll_drawdown', 'f8'),
+                       ('roll_sharpe', 'f8')])
+
+
+@contextmanager
+def quiet():
+    '''
+    silences numpy's warnings about all-nan slices and 0/0, which just
+    give nan for funds with too few dates.
+    '''
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        yield
+
+
+def fund_matrix(groupbyfund, field='nvalues'):
+    '''
+    Lays the GroupByFund arrays out as a fund x date matrix.
+    Returns (fund_ids, days, M) where days is the sorted union of all day
+    ordinals and M[i, j] is the field of fund_ids[i] on days[j], nan where
+    the fund has no row for that day.
+    '''
+    fund_ids = np.array(list(groupbyfund), dtype=np.int32)
+    all_days = np.concatenate([np.asarray(v.days, dtype=np.int32)
+                               for v in groupbyfund.values()])
+    days = np.unique(all_days)
+    M = np.full((len(fund_ids), len(days)), np.nan)
+    for i, v in enumerate(groupbyfund.values()):
+        M[i, np.searchsorted(days, np.asarray(v.days, dtype=np.int32))] = \
+            np.asarray(getattr(v, field))
+    return fund_ids, days, M
+
+
+def ffill(M):
+    '''
+    Carry the last value forward over nan gaps along each row.
+    Leading nans stay nan.
+    '''
+    idx = np.where(np.isnan(M), 0, np.arange(M.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return M[np.arange(M.shape[0])[:, None], idx]
+
+
+def daily_returns(M):
+    '''
+    r[:, j] = M[:, j] / M[:, j-1] - 1 over the gap filled matrix, nan on
+    dates a fund has no row. Shape is one column less than M.
+    '''
+    F = ffill(M)
+    R = F[:, 1:] / F[:, :-1] - 1
+    R[np.isnan(M[:, 1:])] = np.nan
+    return R
+
+
+def drawdown(M):
+    '''
+    M / running max of M - 1, so 0 at a new high and negative below it.
+    '''
+    F = ffill(M)
+    peak = np.fmax.accumulate(F, axis=1)
+    return F / peak - 1
+
+
+def sharpe(R):
+    '''
+    annualized mean / stdev of the daily returns in the last axis.
+    '''
+    with quiet():
+        return np.nanmean(R, axis=-1) / np.nanstd(R, axis=-1, ddof=1) \
+            * np.sqrt(YEAR_DAYS)
+
+
+def rolling(M, window):
+    '''
+    Rolling-window metrics, each a fund x date matrix whose column j covers
+    the window of dates ending at j (nan until window dates are seen):
+    {'mean', 'stdev', 'return', 'drawdown', 'sharpe'}
+    Dates a fund has no row for carry its previous value (see ffill).
+    '''
+    n_funds, n_dates = M.shape
+    out = {k: np.full((n_funds, n_dates), np.nan)
+           for k in ('mean', 'stdev', 'return', 'drawdown', 'sharpe')}
+    if window < 2 or n_dates < window:
+        return out
+    F = ffill(M)
+    W = sliding_window_view(F, window, axis=1)  # funds x windows x window
+    R = np.full((n_funds, n_dates), np.nan)
+    R[:, 1:] = daily_returns(M)
+    RW = sliding_window_view(R, window, axis=1)[:, :, 1:]
+    end = slice(window - 1, None)
+    with quiet():
+        out['mean'][:, end] = np.nanmean(W, axis=2)
+        out['stdev'][:, end] = np.nanstd(W, axis=2, ddof=1)
+        out['return'][:, end] = W[:, :, -1] / W[:, :, 0] - 1
+        peak = np.fmax.accumulate(W, axis=2)
+        out['drawdown'][:, end] = np.nanmin(W / peak - 1, axis=2)
+        out['sharpe'][:, end] = sharpe(RW)
+    return out
+
+
+def rank_table(groupbyfund, window=5):
+    '''
+    Computes every ranking metric for all funds in one vectorized pass over
+    the fund x date matrix of nvalues and returns a structured array of
+    RANK_DTYPE, best mean nvalue first. The roll_* fields are the rolling
+    metrics of the last window dates.
+    '''
+    fund_ids, days, M = fund_matrix(groupbyfund)
+    R = daily_returns(M)
+    F = ffill(M)
+    roll = rolling(M, window)
+    n = np.sum(~np.isnan(M), axis=1)
+    # first and last value of each fund
+    first = M[np.arange(len(M)), np.argmax(~np.isnan(M), axis=1)]
+    last = F[:, -1]
+
+    table = np.zeros(len(fund_ids), dtype=RANK_DTYPE)
+    table['fundId'] = fund_ids
+    table['n'] = n
+    with quiet():
+        table['mean'] = np.nanmean(M, axis=1)
+        table['stdev'] = np.nanstd(M, axis=1, ddof=1)
+        table['mean_return'] = np.nanmean(R, axis=1)
+        table['stdev_return'] = np.nanstd(R, axis=1, ddof=1)
+        table['cum_return'] = last / first - 1
+        table['max_drawdown'] = np.nanmin(drawdown(M), axis=1)
+    table['sharpe'] = sharpe(R)
+    for k in ('mean', 'stdev', 'return', 'drawdown', 'sharpe'):
+        table[f'roll_{k}'] = roll[k][:, -1]
+    return table[np.argsort(-table['mean'], kind='stable')]
+
+
+def rank_running(stats, window=5):
+    '''
+    rank_table from the running statistics {fundId: RunningStats} of
+    running.py instead of the full histories: O(funds) for the whole
+    history metrics, and the roll_* metrics from the last rows of each
+    fund (its tail), which must hold at least window + 1 rows. Same fields
+    and order as rank_table, up to rounding.
+    '''
+    funds = list(stats.values())
+    table = np.zeros(len(funds), dtype=RANK_DTYPE)
+    for f in ('fundId', 'n', 'mean', 'stdev', 'mean_return', 'stdev_return',
+              'max_drawdown'):
+        table[f] = [getattr(s, f) for s in funds]
+    first = np.array([s.first for s in funds])
+    last = np.array([s.last for s in funds])
+    with quiet():
+        table['cum_return'] = last / first - 1
+        table['sharpe'] = table['mean_return'] / table['stdev_return'] \
+            * np.sqrt(YEAR_DAYS)
+    if funds:
+        # the last window dates of all funds, and a row before them to
+        # carry forward, are in the tails: lay them out as rank_table does
+        tails = {s.fundId: GroupTail(s.tail) for s in funds}
+        roll = rolling(fund_matrix(tails)[2], window)
+        for k in ('mean', 'stdev', 'return', 'drawdown', 'sharpe'):
+            table[f'roll_{k}'] = roll[k][:, -1]
+    return table[np.argsort(-table['mean'], kind='stable')]
+
+
+class GroupTail:
+    '''
+    the days and nvalues of a RunningStats tail, as fund_matrix reads
+    them from a GroupByFund.
+    '''
+
+    def __init__(self, tail):
+        self.days = [d for d, nv in tail]
+        self.nvalues = [nv for d, nv in tail]
+
+
+def comoments(X, V):
+    '''
+    The sums of the returns of every pair of funds over the dates both
+    have one, each funds x funds: (n, sx, sxx, sxy) where n[i, j] counts
+    those dates, sx[i, j] and sxx[i, j] sum fund i's returns and their
+    squares and sxy[i, j] their products with fund j's. X holds the
+    returns with 0 where V, the 0/1 mask of the dates with a return, is 0.
+    With the last axis the dates, one product of matrices per sum.
+    '''
+    return V @ V.T, X @ V.T, (X * X) @ V.T, X @ X.T
+
+
+def cov_corr(n, sx, sxx, sxy):
+    '''
+    covariance and correlation matrices of the comoments (see comoments),
+    nan for pairs with less than 2 common dates or a constant fund.
+    '''
+    sy, syy = np.swapaxes(sx, -1, -2), np.swapaxes(sxx, -1, -2)
+    with quiet():
+        cov = (sxy - sx * sy / n) / (n - 1)
+        vx = (sxx - sx * sx / n) / (n - 1)
+        vy = (syy - sy * sy / n) / (n - 1)
+        corr = np.clip(cov / np.sqrt(vx * vy), -1, 1)
+    cov[~(n > 1)] = np.nan
+    corr[~(vx * vy > 0)] = np.nan
+    return cov, corr
+
+
+def rolling_comoments(X, V, window):
+    '''
+    comoments() of the returns of every window of window dates, stacked on
+    a first axis of dates: the sums at j cover the window of dates
+    ending at j (window - 1 returns, the first date's return is 0 in V),
+    nan until window dates are seen. Each sum is the difference of two
+    cumulative sums of the per date products, so all windows together
+    cost funds x funds x dates, whatever the window.
+    '''
+    n_funds, n_dates = X.shape
+    out = []
+    for A, B in ((V, V), (X, V), (X * X, V), (X, X)):
+        S = np.full((n_dates, n_funds, n_funds), np.nan)
+        if 2 <= window <= n_dates:
+            C = np.cumsum(np.einsum('it,jt->tij', A, B), axis=0)
+            # the first date has no return, so C[0] is 0
+            S[window - 1:] = C[window - 1:] - C[:n_dates - window + 1]
+        out.append(S)
+    return out
+
+
+def correlate(groupbyfund, window=20):
+    '''
+    Co-movement of all funds: their nvalues are laid on the common date
+    grid of fund_matrix, and the daily returns of each pair of funds are
+    compared over the dates both have one (a fund with no row on a date
+    has no return that date or the next, see daily_returns). Returns
+    {'fund_ids', 'days', 'n', 'cov', 'corr', 'roll_cov', 'roll_corr'}
+    where n, cov and corr are funds x funds over the whole range and
+    roll_cov, roll_corr are dates x funds x funds over the window of
+    window dates ending at each date (see rolling_comoments).
+    '''
+    fund_ids, days, M = fund_matrix(groupbyfund)
+    R = np.full(M.shape, np.nan)
+    R[:, 1:] = daily_returns(M)
+    V = (~np.isnan(R)).astype(float)
+    X = np.where(V > 0, R, 0.0)
+    n, sx, sxx, sxy = comoments(X, V)
+    cov, corr = cov_corr(n, sx, sxx, sxy)
+    roll_cov, roll_corr = cov_corr(*rolling_comoments(X, V, window))
+    return {'fund_ids': fund_ids, 'days': days, 'n': n.astype(np.int32),
+            'cov': cov, 'corr': corr, 'roll_cov': roll_cov,
+            'roll_corr': roll_corr}
+
+
+class ResultCache:
+    '''
+    Keeps the arrays of one result, eg: of correlate(), in an .npz file
+    with the key they were computed for: the version of the stored rows
+    (see Pipeline.data_version) and the arguments. get(key) returns them,
+    from memory or the file, only while the key matches, so they are
+    computed again after rows are ingested and not before.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.key = None
+        self.arrays = None
+
+    def get(self, key):
+        if self.key != key and os.path.exists(self.path):
+            with np.load(self.path) as npz:
+                if str(npz['key']) == key:
+                    self.key = key
+                    self.arrays = {k: npz[k] for k in npz.files
+                                   if k != 'key'}
+        return self.arrays if self.key == key else None
+
+    def put(self, key, arrays):
+        '''
+        writes a temp file renamed over path, as save_table does.
+        '''
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'wb') as file:
+            np.savez(file, key=np.array(key), **arrays)
+        os.replace(tmp, self.path)
+        self.key, self.arrays = key, arrays
+
+
+def save_correlation(result, path):
+    '''
+    Writes a correlate() result as json: the fundIds, the first and last
+    isodate, and n, cov and corr over the range and over the last window
+    ({'roll_cov', 'roll_corr'}), nan as null.
+    '''
+    import json
+    from records import isodate
+
+    def rows(A):
+        return [[None if v != v else v for v in row] for row in A.tolist()]
+
+    days = result['days']
+    data = {'fund_ids': result['fund_ids'].tolist(),
+            'start': isodate(days[0]) if len(days) else None,
+            'end': isodate(days[-1]) if len(days) else None,
+            'n': result['n'].tolist(), 'cov': rows(result['cov']),
+            'corr': rows(result['corr'])}
+    if len(days):
+        data['roll_cov'] = rows(result['roll_cov'][-1])
+        data['roll_corr'] = rows(result['roll_corr'][-1])
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        file.write(json.dumps(data, indent=1) + '\n')
+    os.replace(tmp, path)
+
+
+def save_table(table, path):
+    '''
+    Writes a rank_table as a json list of {field: value}, best first, nan
+    as null, to a temp file renamed over path, so readers never see a
+    half written file.
+    '''
+    import json
+    rows = [{f: (None if v != v else v) for f, v in zip(
+        table.dtype.names, row.tolist())} for row in table]
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        file.write(json.dumps(rows, indent=1) + '\n')
+    os.replace(tmp, path)
@@ -0,0 +1,61 @@
+# file: archive.py
+
+import gzip
+import os
+import tarfile
+import zipfile
+
+# saved pages, alone or inside an archive
+PAGES = ('.html', '.htm', '.html.gz', '.htm.gz')
+# files holding pages that are read without extracting them to disk
+PACKED = ('.html.gz', '.htm.gz', '.zip', '.tar', '.tar.gz', '.tgz',
+          '.tar.bz2', '.tar.xz')
+
+
+def is_page(name):
+    return name.lower().endswith(PAGES)
+
+
+def is_packed(name):
+    return name.lower().endswith(PACKED)
+
+
+def is_source(name):
+    '''
+    True for the files ingestion takes: pages and archives of pages.
+    '''
+    return is_page(name) or is_packed(name)
+
+
+def unpack(name, data):
+    '''
+    the html of the page data named name, gunzipped if it ends with .gz
+    '''
+    return gzip.decompress(data) if name.lower().endswith('.gz') else data
+
+
+def pages(path):
+    '''
+    Yields (name, html bytes) for each page in path, which is a .html.gz
+    file, a zip file or a tar file (plain or compressed). name is
+    '<archive file>!<member>'. A tar file is read as a stream, member by
+    member, and a zip file member by member, so only one page at a time is
+    held in memory and nothing is written to disk.
+    '''
+    base = os.path.basename(path)
+    low = base.lower()
+    if low.endswith(('.html.gz', '.htm.gz')):
+        with gzip.open(path, 'rb') as page:
+            yield f'{base}!{base[:-3]}', page.read()
+    elif low.endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and is_page(info.filename):
+                    yield (f'{base}!{info.filename}',
+                           unpack(info.filename, zf.read(info)))
+    else:
+        with tarfile.open(path, 'r|*') as tf:
+            for member in tf:
+                if member.isfile() and is_page(member.name):
+                    data = tf.extractfile(member).read()
+                    yield f'{base}!{member.name}', unpack(member.name, data)
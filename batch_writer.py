@@ -0,0 +1,121 @@
+# file: batch_writer.py
+
+import csv
+import io
+import os
+
+
+class CsvBatchWriter:
+    '''
+    Collects JacksonFund records, for a page or a whole scrape, and commits
+    them to detailsByDate.csv with one buffered write through the csv module.
+    A commit is atomic:
+    append(): the new rows and the old size of the csv file are first
+        written to csv_file.journal, then appended to the csv file in one
+        write. If the process dies in between, the next CsvBatchWriter on
+        the same file cuts the csv file back to the old size and replays
+        the journal, so a page is never half written.
+    upsert(): rows of new (fundId, date) are appended, whatever their date,
+        since the readers key rows on their date, not on their place in
+        the file. Only when rows replace existing ones is the csv file
+        rewritten, streamed line by line to a temp file that is renamed
+        over the old one.
+    Rows are: fundId,name,invested,future_pct,actual_pct,num_units,
+    unit_value,value,nvalue,date with the spaces removed from name,
+    invested, the percentages and num_units as the page gave them (see
+    JacksonFund.text) and the isodate.
+    '''
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.journal_file = f'{csv_file}.journal'
+        self.jfs = []
+        self.recover()
+
+    def add(self, jf):
+        self.jfs.append(jf)
+
+    def extend(self, jfs):
+        self.jfs.extend(jfs)
+
+    def row(self, jf):
+        '''
+        the csv fields of one JacksonFund
+        '''
+        return [jf.fundId, jf.name.replace(' ', ''), jf.text('invested'),
+                jf.text('future_pct'), jf.text('actual_pct'),
+                jf.text('num_units'), repr(jf.unit_value), repr(jf.value),
+                repr(jf.nvalue), jf.date]
+
+    def text(self, rows):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator='\n').writerows(rows)
+        return buf.getvalue()
+
+    def recover(self):
+        '''
+        Roll forward an append that was interrupted before it finished.
+        '''
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r', newline='') as journal:
+            size = int(journal.readline())
+            data = journal.read()
+        with open(self.csv_file, 'a', newline='') as csv_data:
+            csv_data.truncate(size)
+            csv_data.write(data)
+            csv_data.flush()
+            os.fsync(csv_data.fileno())
+        os.remove(self.journal_file)
+
+    def append(self):
+        '''
+        Append the collected rows to the csv file in one journaled write.
+        '''
+        if not self.jfs:
+            return
+        data = self.text(self.row(jf) for jf in self.jfs)
+        size = os.path.getsize(self.csv_file) \
+            if os.path.exists(self.csv_file) else 0
+        tmp = f'{self.journal_file}.tmp'
+        with open(tmp, 'w', newline='') as journal:
+            journal.write(f'{size}\n{data}')
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp, self.journal_file)
+        with open(self.csv_file, 'a', newline='') as csv_data:
+            csv_data.write(data)
+            csv_data.flush()
+            os.fsync(csv_data.fileno())
+        os.remove(self.journal_file)
+        self.jfs = []
+
+    def upsert(self, stored):
+        '''
+        Commit the collected rows, replacing rows with the same
+        (fundId, date). When none of their keys is one of the stored
+        (fundId, date) keys already in the file the rows are appended, also
+        when they are older (a page scraped out of order); otherwise the
+        old rows are streamed, one line at a time, to a temp file without
+        the replaced ones, the new rows are written after them and the
+        temp file is renamed over the old one. Memory does not grow with
+        the size of the csv.
+        '''
+        if not self.jfs:
+            return
+        keys = {(jf.fundId, jf.date) for jf in self.jfs}
+        if keys.isdisjoint(stored):
+            self.append()
+            return
+        tmp = f'{self.csv_file}.tmp'
+        with open(tmp, 'w', newline='') as out:
+            writer = csv.writer(out, lineterminator='\n')
+            if os.path.exists(self.csv_file):
+                with open(self.csv_file, 'r', newline='') as csv_data:
+                    writer.writerows(row for row in csv.reader(csv_data)
+                                     if (int(row[0]), row[9]) not in keys)
+            writer.writerows(self.row(jf) for jf in self.jfs)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.csv_file)
+        self.jfs = []
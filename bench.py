@@ -0,0 +1,326 @@
+# file: bench.py
+'''
+Synthetic-scale benchmark of the scrape -> csv -> group -> rank -> plot
+pipeline and of the batch chart rendering. Pages are generated from a
+real saved page in recover/, in the exact layouts that
+RecoverJackson.read_page (values dialog) and ScrapeSavePlot.read_page
+(details page) expect, for N funds x M dates.
+    python bench.py --funds 8 --dates 250 --workers 4
+    python bench.py --layout details --dates 1000 --memory --out bench_output.txt
+Each stage reports wall time, throughput and, with --memory, the peak of
+python allocations (tracemalloc, which slows the stage down). The max RSS
+of the process is reported after every stage.
+'''
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import layouts
+import metrics
+import registry
+import recover_spt
+
+ROWS = 10  # subaccount rows on a real page
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'recover', 'sep01.html')
+
+VALUES_ROW = ('<tr data-ri="{i}" class="ui-widget-content ui-datatable-{eo}"'
+              ' role="row"><td role="gridcell">{name}</td>'
+              '<td role="gridcell" class="alignRight">{units}</td>'
+              '<td role="gridcell" class="alignRight">{uv}</td>'
+              '<td role="gridcell" class="alignRight">{value}</td>'
+              '<td role="gridcell" class="alignRight">{units}</td>'
+              '<td role="gridcell" class="alignRight">{uv}</td>'
+              '<td role="gridcell" class="alignRight">{value}</td></tr>')
+
+DETAILS_ROW = ('<tr data-ri="{i}" class="ui-widget-content ui-datatable-{eo}"'
+               ' role="row"><td role="gridcell" class="alignCenter">\n'
+               '\t\t\t\t\t\t<span class="table-row-legend" '
+               'style="background-color: #8a7143"></span></td>'
+               '<td role="gridcell">{name}</td>'
+               '<td role="gridcell">{actual}</td>'
+               '<td role="gridcell">{future}</td>'
+               '<td role="gridcell">{units}</td>'
+               '<td role="gridcell">{uv}</td>'
+               '<td role="gridcell">{value}</td></tr>')
+
+
+def synth_funds(n):
+    '''
+    [(display name, FundInfo)] of n funds: the real subaccounts first,
+    then made up ones, and the lookupfund dict that knows all of them.
+    '''
+    FundInfo = recover_spt.FundInfo
+    real = [('JNL/BlackRock® Global Natural Resources', 66),
+            ('JNL/DFA U.S. Core Equity', 115),
+            ('JNL/Invesco Diversified Dividend', 365),
+            ('JNL/Mellon Consumer Staples Sector', 368),
+            ('JNL/Mellon Energy Sector', 190),
+            ('JNL/Mellon Nasdaq® 100 Index', 222),
+            ('JNL/Mellon Utilities Sector', 635),
+            ('JNL/Newton Equity Income', 606)]
+    lookup = {'JacksonFunds': recover_spt.lookupfund['JacksonFunds']}
+    funds = []
+    # a saved page lists ROWS subaccounts: pages of fewer funds are padded
+    # with funds missing from lookup, which the extractor skips, so every
+    # page costs about what a real one does to parse
+    for k in range(max(n, ROWS)):
+        if k >= n:
+            funds.append((f'JNL/Untracked Fund {k:04d}',
+                          FundInfo(None, 6000, '0%')))
+            continue
+        if k < len(real):
+            name = real[k][0]
+            info = recover_spt.lookupfund[name.replace(' ', '')]
+        else:
+            name = f'JNL/Synthetic Fund {k:04d}'
+            info = FundInfo(1000 + k, 6000, '10%')
+        lookup[name.replace(' ', '')] = info
+        funds.append((name, info))
+    return funds, lookup
+
+
+def trading_days(m, start=datetime.date(2020, 1, 2)):
+    days = []
+    d = start
+    while len(days) < m:
+        if d.weekday() < 5:
+            days.append(d)
+        d += datetime.timedelta(days=1)
+    return days
+
+
+def replace_after(html, anchor, pattern, repl, count=1):
+    '''
+    replace the first count matches of pattern after the text anchor.
+    '''
+    i = html.index(anchor)
+    head, tail = html[:i], html[i:]
+    return head + re.sub(pattern, repl, tail, count=count)
+
+
+def replace_tbody(html, tbody_id, rows):
+    i = html.index(f'<tbody id="{tbody_id}"')
+    start = html.index('>', i) + 1
+    end = html.index('</tbody>', start)
+    return html[:start] + rows + html[end:]
+
+
+def synth_page(template, day, funds, units, prices):
+    '''
+    One saved page for day holding both layouts: the values dialog and the
+    details page, with fund k worth units[k] * prices[k].
+    '''
+    mdy = day.strftime('%m/%d/%Y')
+    values = [u * p for u, p in zip(units, prices)]
+    # keep the total in the $dd,ddd.dd form the details regex expects
+    total = 60000 * sum(values) / sum(u * 10 for u in units)
+    total = min(max(total, 10000.0), 99999.0)
+    vrows = []
+    drows = []
+    for k, (name, info) in enumerate(funds):
+        eo = 'even' if k % 2 == 0 else 'odd'
+        cells = dict(i=k, eo=eo, name=name, units=f'{units[k]:.4f}',
+                     uv=f'{prices[k]:.6f}', value=f'${values[k]:,.2f}')
+        vrows.append(VALUES_ROW.format(**cells))
+        drows.append(DETAILS_ROW.format(
+            actual=f'{100 * values[k] / sum(values):.2f}%',
+            future=f'{info.allocated.rstrip("%")}.00%', **cells))
+    html = template
+    # both columns, the selected date and today's, as if saved that day
+    html = replace_after(html, layouts.VALUES.dialog_id,
+                         r'(Value As of\s*)\d\d/\d\d/\d{4}',
+                         lambda m: m.group(1) + mdy, 2)
+    html = replace_after(html, 'Total Contract Value</td>',
+                         r'\$[\d,]+\.\d\d', f'${total:,.2f}', 2)
+    html = replace_tbody(html, 'dialogForm:valueAsOfSubaccountTable_data',
+                         ''.join(vrows))
+    html = replace_after(html, 'id="policyDetailsForm:valueAsOfDate_input"',
+                         r'value="[^"]*"', f'value="{mdy}"')
+    html = replace_after(html, 'Accumulated Value:</span>',
+                         r'\$[\d,]+\.\d\d', f'${total:,.2f}')
+    html = replace_tbody(html, 'dialogForm:assetAllocation_dataTable_data',
+                         ''.join(drows))
+    return html
+
+
+def generate(directory, n_funds, n_dates, seed=1):
+    '''
+    Writes n_dates pages for n_funds funds into directory, prices follow
+    a random walk. Returns (files, lookupfund).
+    '''
+    with open(TEMPLATE, encoding='utf-8') as f:
+        template = f.read()
+    funds, lookup = synth_funds(n_funds)
+    rnd = random.Random(seed)
+    units = [info.invested / 10 for name, info in funds]
+    prices = [10.0] * len(funds)
+    files = []
+    for day in trading_days(n_dates):
+        prices = [p * (1 + rnd.gauss(0.0003, 0.012)) for p in prices]
+        file = f'p{day.isoformat()}.html'
+        with open(os.path.join(directory, file), 'w', encoding='utf-8') as f:
+            f.write(synth_page(template, day, funds, units, prices))
+        files.append(file)
+    return files, lookup
+
+
+def make_reader(layout, workdir, lookup):
+    '''
+    RecoverJackson (values) or ScrapeSavePlot (details) with every file
+    it writes inside workdir, built as the command line builds it.
+    '''
+    if layout == 'details':
+        from scrape_jackson import ScrapeSavePlot as Reader
+        import scrape_spt as spt
+    else:
+        from recover import RecoverJackson as Reader
+        spt = recover_spt
+    account = registry.Account.from_lookup(
+        'bench', lookup, spt.registry.account().total.units)
+    # the synthetic pages hold both layouts: read the one asked for
+    return Reader(account=account, workdir=workdir, sniff=False)
+
+
+class Bench:
+    '''
+    Runs and records the stages.
+    '''
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.results = []
+
+    def stage(self, name, fn, units=None, unit='items'):
+        '''
+        time fn() and record {stage, seconds, <unit>/s, peak_mb, maxrss_mb}.
+        Output printed by the pipeline is discarded.
+        '''
+        if self.memory:
+            tracemalloc.start()
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            value = fn()
+        dt = time.perf_counter() - t
+        rec = {'stage': name, 'seconds': round(dt, 4)}
+        if units is not None:
+            rec[unit] = units
+            rec[f'{unit}_per_s'] = round(units / dt, 1) if dt else None
+        if self.memory:
+            rec['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20,
+                                   2)
+            tracemalloc.stop()
+        # linux reports ru_maxrss in KiB, macOS in bytes
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rec['maxrss_mb'] = round(rss / (2**20 if sys.platform == 'darwin'
+                                        else 2**10), 1)
+        self.results.append(rec)
+        print(' '.join(f'{k}={v}' for k, v in rec.items()))
+        return value
+
+
+def run(args):
+    workdir = args.keep or tempfile.mkdtemp(prefix='jackson_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    bench = Bench(args.memory)
+    print(f'{args.layout} pages, {args.funds} funds x {args.dates} dates '
+          f'in {workdir}')
+    files, lookup = bench.stage(
+        'generate', lambda: generate(workdir, args.funds, args.dates),
+        args.dates, 'pages')
+    mb = sum(os.path.getsize(os.path.join(workdir, f)) for f in files) / 2**20
+    reader = make_reader(args.layout, workdir, lookup)
+    # the logger writes to the real stdout, which stage() does not redirect
+    metrics.setup('WARNING')
+
+    import ingest
+    # parse without the page cache first, then fill it and read from it
+    cache, reader.page_cache = reader.page_cache, None
+    pages = bench.stage('parse serial',
+                        lambda: [(f, reader.read_page(f)) for f in files],
+                        len(files), 'pages')
+    # one row per fund and date, as ingest writes them
+    jfs = ingest.merge_rows(pages)
+    serial = bench.results[-1]
+    serial.update(rows=len(jfs), mb_per_s=round(mb / serial['seconds'], 2))
+    if args.workers > 1:
+        bench.stage('parse workers',
+                    lambda: ingest.read_pages(reader, files, args.workers),
+                    len(files), 'pages')
+    reader.page_cache = cache
+    for name in ('parse cache fill', 'parse cached'):
+        bench.stage(name, lambda: [reader.read_page(f) for f in files],
+                    len(files), 'pages')
+
+    from batch_writer import CsvBatchWriter
+
+    def write_csv():
+        writer = CsvBatchWriter(reader.csv_file)
+        writer.extend(jfs)
+        writer.append()
+    bench.stage('csv write', write_csv, len(jfs), 'rows')
+    bench.stage('group_by_fund', reader.group_by_fund, len(jfs), 'rows')
+    bench.stage('group_by_fund again', reader.group_by_fund)
+    n_funds = len(reader.groupbyfund)
+    # the first ranking builds the running statistics from every row, the
+    # next one only reads them; ranking a date range uses the histories
+    bench.stage('rank_funds', reader.rank_funds, n_funds, 'funds')
+    bench.stage('rank_funds again', reader.rank_funds, n_funds, 'funds')
+    bench.stage('rank_funds histories',
+                lambda: reader.rank_funds(start='1970-01-01'), n_funds,
+                'funds')
+    # the first correlate() computes the matrices, the next one finds them
+    # in the cache, as nothing was ingested in between
+    corr = os.path.join(workdir, 'corr.json')
+    bench.stage('correlate', lambda: reader.correlate(out=corr), n_funds,
+                'funds')
+    bench.stage('correlate again', lambda: reader.correlate(out=corr),
+                n_funds, 'funds')
+    if not args.no_plot:
+        png = os.path.join(workdir, 'plot.png')
+        bench.stage('plot', lambda: reader.plot_normalized(out=png),
+                    len(jfs), 'points')
+        charts = os.path.join(workdir, 'charts')
+        bench.stage('render charts', lambda: reader.render_charts(charts),
+                    len(jfs), 'points')
+
+    if args.out:
+        with open(args.out, 'a') as out:
+            for rec in bench.results:
+                rec.update(layout=args.layout, funds=args.funds,
+                           dates=args.dates)
+                out.write(json.dumps(rec) + '\n')
+    if not args.keep:
+        shutil.rmtree(workdir)
+    return bench.results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    ap.add_argument('--funds', type=int, default=8)
+    ap.add_argument('--dates', type=int, default=250)
+    ap.add_argument('--layout', choices=('values', 'details'),
+                    default='values')
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    ap.add_argument('--memory', action='store_true',
+                    help='measure peak allocations with tracemalloc')
+    ap.add_argument('--no-plot', action='store_true')
+    ap.add_argument('--out', help='append results as json lines to this file')
+    ap.add_argument('--keep', help='generate into (and keep) this directory')
+    run(ap.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
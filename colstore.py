@@ -0,0 +1,228 @@
+# file: colstore.py
+
+import csv
+import datetime
+import json
+import os
+import struct
+from array import array
+from collections import namedtuple
+import numpy as np
+from records import pct, num, dump_groups
+
+MAGIC = b'JFCOLS01'
+# (name, dtype) of the per fund columns, in file order.
+COLUMNS = [('days', '<i4'), ('values', '<f8'), ('nvalues', '<f8'),
+           ('num_units', '<f8'), ('unit_values', '<f8'),
+           ('future_pct', '<f8'), ('actual_pct', '<f8'),
+           ('invested', '<f8')]
+# rebuilt once the csv grew by more than 1/SLACK past what the store holds
+SLACK = 8
+
+FundSeries = namedtuple('FundSeries', ['fundId', 'name', 'allocated',
+                                       'percent']
+                        + [c[0] for c in COLUMNS])
+
+
+def write_store(csv_file, store_file, isodate, version=None, chunk=4096):
+    '''
+    Builds the column store from detailsByDate.csv. Layout:
+    MAGIC, uint64 header length, json header (padded to 8 bytes), then for
+    each fund its columns (see COLUMNS) one after the other, each 8 byte
+    aligned. The header lists every fund with its name, invested (of its
+    first csv row, as group_by_fund takes it), allocated and percent (of
+    its earliest row), row count n and the byte offset of each column
+    from the end of the header; it also holds version, the [ino, offset,
+    tail] of the csv (see GroupCache.version): only the csv up to offset
+    is read, so rows appended meanwhile are left to the next reader.
+    Dates are stored as day ordinals, and the
+    rows of each fund are sorted by day, whatever their order in the csv.
+    The csv is streamed twice: the first pass counts the rows of each fund
+    to lay the file out, the second writes the rows into a memory map of
+    it, chunk rows of a fund at a time. Then each fund is sorted in place,
+    if it is not already in order. So memory holds at most one fund's
+    history, not the whole csv.
+    '''
+    end = version[1] if version else None
+    funds = dict()  # {fundId: header entry}
+    first = dict()  # {fundId: its earliest isodate}
+    for row in csv_rows(csv_file, end):
+        fid = int(row[0])
+        date = isodate(row[9])
+        entry = funds.get(fid)
+        if entry is None:
+            entry = funds[fid] = {'fundId': fid, 'name': row[1],
+                                  'invested': float(row[2]), 'n': 0}
+        if fid not in first or date < first[fid]:
+            first[fid] = date
+            entry['allocated'], entry['percent'] = row[3], row[4]
+        entry['n'] += 1
+
+    offset = 0
+    for entry in funds.values():
+        entry['offsets'] = dict()
+        for name, dtype in COLUMNS:
+            entry['offsets'][name] = offset
+            size = entry['n'] * np.dtype(dtype).itemsize
+            offset += size + (-size % 8)
+    header = {'columns': COLUMNS, 'funds': list(funds.values()),
+              'version': version}
+    head = json.dumps(header).encode('utf-8')
+    head += b' ' * (-len(head) % 8)
+    base = 16 + len(head)
+    tmp = f'{store_file}.tmp'
+    with open(tmp, 'wb') as store:
+        store.write(MAGIC + struct.pack('<Q', len(head)) + head)
+        store.truncate(base + offset)
+    if offset:
+        mm = np.memmap(tmp, dtype=np.uint8, mode='r+', offset=base,
+                       shape=(offset,))
+        views = {fid: [np.frombuffer(mm, dtype=dtype, count=e['n'],
+                                     offset=e['offsets'][name])
+                       for name, dtype in COLUMNS]
+                 for fid, e in funds.items()}
+        fill_store(csv_file, end, isodate, funds, views, chunk)
+        for cols in views.values():
+            days = cols[0]
+            if len(days) > 1 and np.any(days[1:] < days[:-1]):
+                order = np.argsort(days, kind='stable')
+                for col in cols:
+                    col[:] = col[order]
+        mm.flush()
+        del views, mm
+    # replace atomically, so open memory maps of the old file stay valid
+    os.replace(tmp, store_file)
+
+
+def csv_rows(csv_file, end=None):
+    '''
+    Yields the csv rows, up to the byte offset end (a line end) if given.
+    '''
+    with open(csv_file, 'rb') as file:
+
+        def lines():
+            pos = 0
+            for line in file:
+                pos += len(line)
+                if end is not None and pos > end:
+                    return
+                yield line.decode('utf-8')
+        yield from csv.reader(lines())
+
+
+def fill_store(csv_file, end, isodate, funds, views, chunk):
+    '''
+    Writes the csv rows up to end into views {fundId: [column view]} of
+    the store, in csv order, through a buffer of chunk rows per fund.
+    '''
+    bufs = {fid: [] for fid in funds}
+    done = dict.fromkeys(funds, 0)
+
+    def flush(fid):
+        rows = bufs[fid]
+        i = done[fid]
+        for col, values in zip(views[fid], zip(*rows)):
+            col[i:i + len(rows)] = values
+        done[fid] = i + len(rows)
+        bufs[fid] = []
+
+    for row in csv_rows(csv_file, end):
+        fid = int(row[0])
+        iv, val = float(row[2]), float(row[7])
+        bufs[fid].append((
+            datetime.date.fromisoformat(isodate(row[9])).toordinal(), val,
+            round(val / iv, 3), float(row[5]),
+            float(row[6]), pct(row[3]), pct(row[4]), iv))
+        if len(bufs[fid]) >= chunk:
+            flush(fid)
+    for fid in funds:
+        if bufs[fid]:
+            flush(fid)
+
+
+class ColumnStore:
+    '''
+    Read side of the column store written by write_store(). The file is
+    memory mapped and fund(fundId) returns numpy views into the map, so
+    loading one fund's history copies nothing and costs the same whatever
+    the size of the file.
+    '''
+
+    def __init__(self, store_file):
+        self.store_file = store_file
+        self.mm = np.memmap(store_file, dtype=np.uint8, mode='r')
+        if bytes(self.mm[:8]) != MAGIC:
+            raise ValueError(f'{store_file} is not a JacksonFunds store')
+        hlen = struct.unpack('<Q', bytes(self.mm[8:16]))[0]
+        header = json.loads(bytes(self.mm[16:16 + hlen]).decode('utf-8'))
+        self.base = 16 + hlen
+        self.funds = {f['fundId']: f for f in header['funds']}
+        self.version = header.get('version')
+
+    def fund_ids(self):
+        return list(self.funds)
+
+    def fund(self, fundId):
+        '''
+        FundSeries of fundId whose columns are read-only views of the map.
+        '''
+        f = self.funds[fundId]
+        cols = [np.frombuffer(self.mm, dtype=dtype, count=f['n'],
+                              offset=self.base + f['offsets'][name])
+                for name, dtype in COLUMNS]
+        return FundSeries(f['fundId'], f['name'], f['allocated'],
+                          f['percent'], *cols)
+
+    def dates(self, fundId):
+        '''
+        the isodates of fundId, eg: '2022-09-01'
+        '''
+        return [datetime.date.fromordinal(int(d)).isoformat()
+                for d in self.fund(fundId).days]
+
+    def group_by_fund(self, GroupByFund):
+        '''
+        {fundId: GroupByFund}, as built by group_by_fund() from the csv
+        file. GroupByFund is the class of the spt module (records.py); the
+        columns are copied into its arrays as raw bytes.
+        '''
+        gbf = dict()
+        for fid, f in self.funds.items():
+            s = self.fund(fid)
+            gbf[fid] = GroupByFund(fid, f['invested'], s.allocated, s.percent,
+                                   array('i', s.days.tobytes()),
+                                   array('d', s.values.tobytes()),
+                                   array('d', s.nvalues.tobytes()))
+        return gbf
+
+    def to_json(self, json_file, GroupByFund):
+        '''
+        export in the groupByfund.json format.
+        '''
+        with open(json_file, 'w') as file:
+            dump_groups(self.group_by_fund(GroupByFund), file)
+
+    def to_csv(self, csv_file):
+        '''
+        export in the detailsByDate.csv format, in date order. invested,
+        num_units and percentages are written in their shortest form,
+        eg: 9000.0 -> 9000, 15.00% -> 15%.
+        '''
+        rows = []
+        for order, fid in enumerate(self.funds):
+            s = self.fund(fid)
+            for i in range(len(s.days)):
+                fp = '' if np.isnan(s.future_pct[i]) \
+                    else f'{num(s.future_pct[i])}%'
+                ap = '' if np.isnan(s.actual_pct[i]) \
+                    else f'{num(s.actual_pct[i])}%'
+                date = datetime.date.fromordinal(int(s.days[i])).isoformat()
+                rows.append((int(s.days[i]), order,
+                             [fid, s.name, num(s.invested[i]), fp, ap,
+                              num(s.num_units[i]),
+                              repr(float(s.unit_values[i])),
+                              repr(float(s.values[i])),
+                              repr(float(s.nvalues[i])), date]))
+        rows.sort(key=lambda r: (r[0], r[1]))
+        with open(csv_file, 'w', newline='') as file:
+            csv.writer(file, lineterminator='\n').writerows(r[2] for r in rows)
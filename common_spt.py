@@ -0,0 +1,71 @@
+# file: common_spt.py
+# The settings recover_spt.py and scrape_spt.py share; each of them
+# imports these and adds the paths of its own directory.
+
+import os
+from registry import FundInfo, load as load_registry  # noqa: F401
+
+# where scraped rows are stored: 'csv' (detailsByDate.csv) or 'sqlite'.
+backend = 'csv'
+backends = ('csv', 'sqlite')
+
+# html parser backend used by open_and_read. 'lxml' and 'html.parser' only
+# build the elements of the page's layout (see layouts.py); 'html5lib'
+# builds the whole page.
+parser = 'lxml'
+parsers = ('lxml', 'html.parser', 'html5lib')
+# read each page with the layout whose marker is in its first bytes (a
+# values page or a details page, see layouts.detect); False reads every
+# page with the reader's own layout.
+sniff_layout = True
+
+# pages parsed and committed per batch by an ingest, and the ceiling in
+# MB on the resident memory of the ingest (None: no ceiling); above it
+# batches are halved. See ingest.Budget.
+ingest_batch = 256
+memory_mb = None
+
+# worker processes used by scrape_many_html (scrape_all_html) to parse
+# pages.
+workers = os.cpu_count() or 1
+
+# dates in the rolling window of rank_funds metrics.
+rank_window = 5
+
+# dates in the rolling window of the correlate() matrices, kept in
+# corr_file until rows are ingested.
+corr_window = 20
+
+# most dates a fund's curve is drawn with: longer ranges are plotted from
+# the weekly, monthly or quarterly closes of the rollups (see rollup.py).
+plot_points = 600
+
+# watch mode (python -m jackson watch): seconds a new page must stay
+# unchanged before it is read, and seconds between directory scans when
+# inotify is not available.
+watch_settle = 2.0
+watch_interval = 5.0
+
+# size of the cache of the texts extracted from each page, keyed by the
+# sha256 of the html (see page_cache.py). Entries are tagged with the
+# layout's version (see layouts.py), so old entries are not used after an
+# extractor change.
+page_cache_bytes = 64 * 2**20
+
+# the accounts (policies), their funds, investments and allocation
+# history are data, in registry_file (see registry.py and funds.json).
+# account is the one read and written unless a reader is given another;
+# each other account keeps its pages and files in <dir>/<account>/.
+registry_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'funds.json')
+registry = load_registry(registry_file)
+account = registry.default
+
+# {name: FundInfo} of the default account, to get fundId, invested,
+# allocated given the fund name (with its spaces removed)
+lookupfund = registry.account().lookupfund()
+
+# JacksonFund (one scraped row) and GroupByFund (one fund's history) are
+# compact typed records, see records.py. Their text form, '15%' and
+# isodates, is only used in the csv, json and sqlite files.
+from records import JacksonFund, GroupByFund  # noqa: E402,F401
@@ -0,0 +1,220 @@
+# file: fetch.py
+
+import asyncio
+import datetime
+import http.client
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+from metrics import log, metrics
+from records import day, isodate, trading_day
+
+# answers worth asking again: rate limited or a server/gateway hiccup
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    '''
+    a page could not be fetched: a status that is not worth retrying, or
+    the last error after every retry.
+    '''
+
+
+def url_fields(date):
+    '''
+    the fields a page path can use, for the isodate date:
+    {iso} 2022-09-01, {mmm} sep, {dd} 01, {mm} 09, {yyyy} 2022 and
+    {mdy} 09/01/2022, the date as jackson writes it.
+    '''
+    d = datetime.date.fromisoformat(date)
+    return {'iso': date, 'mmm': d.strftime('%b').lower(),
+            'dd': f'{d.day:02d}', 'mm': f'{d.month:02d}',
+            'yyyy': f'{d.year}', 'mdy': d.strftime('%m/%d/%Y')}
+
+
+def trading_days(start, end):
+    '''
+    isodates of the trading days (monday to friday) from start to end.
+    '''
+    return [isodate(d) for d in range(day(start), day(end) + 1)
+            if trading_day(d)]
+
+
+class ConnectionPool:
+    '''
+    Keep-alive http(s) connections to the host of base_url, at most size
+    of them. get() lends an idle connection (or opens one), put() takes
+    it back unless the server is closing it, so pages after the first
+    skip the tcp (and tls) handshake.
+    '''
+
+    def __init__(self, base_url, size=4, timeout=30):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        metrics.count('connections')
+        cls = http.client.HTTPSConnection if self.https \
+            else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def put(self, conn):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+
+class Fetcher:
+    '''
+    Fetches the values pages of many dates concurrently from base_url,
+    eg: http://127.0.0.1:8000/ for a stand-in server of the saved
+    recover/*.html pages (python -m http.server -d recover 8000).
+    path is the page path under base_url, a format string of the fields
+    of url_fields, eg: '{mmm}{dd}.html' or 'values?date={mdy}'.
+    At most concurrency requests are in flight, on a ConnectionPool of
+    as many connections; rate (requests per second, None is unlimited)
+    spaces out the starts of requests. A failed request (connection error
+    or RETRY_STATUS) is tried again retries times, after backoff * 2**n
+    seconds plus jitter, or the Retry-After the server asked for.
+    headers are sent with every request, eg: the Cookie of a logged in
+    browser session, which jackson.com needs.
+    http.client does the blocking io in a pool of concurrency threads and
+    asyncio schedules the requests, so no http library is needed.
+    '''
+
+    def __init__(self, base_url, path='{mmm}{dd}.html', concurrency=4,
+                 rate=None, retries=3, backoff=0.5, timeout=30, headers=None):
+        self.base_url = base_url if base_url.endswith('/') \
+            else f'{base_url}/'
+        self.path = path
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = dict(headers or {})
+        self.pool = ConnectionPool(self.base_url, concurrency, timeout)
+        self.failed = dict()  # {url: error}
+        self.next_start = 0.0
+
+    def url(self, date):
+        return urljoin(self.base_url, self.path.format(**url_fields(date)))
+
+    def get(self, url):
+        '''
+        One blocking GET of url on a pooled connection: (status,
+        retry_after, body). A connection that failed is dropped.
+        '''
+        parts = urlsplit(url)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        conn = self.pool.get()
+        try:
+            conn.request('GET', target, headers=self.headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.put(conn)
+        return resp.status, resp.getheader('Retry-After'), body
+
+    async def throttle(self):
+        '''
+        waits until the next request may start, at most rate per second.
+        '''
+        if not self.rate:
+            return
+        now = time.monotonic()
+        start = max(now, self.next_start)
+        self.next_start = start + 1 / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def fetch(self, url, limit, executor):
+        '''
+        the body of url, retried as the class doc says; raises FetchError.
+        '''
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                metrics.count('fetch_retries')
+            async with limit:
+                await self.throttle()
+                try:
+                    status, retry_after, body = \
+                        await asyncio.get_running_loop().run_in_executor(
+                            executor, self.get, url)
+                except (OSError, http.client.HTTPException) as err:
+                    status, retry_after, error = None, None, repr(err)
+                else:
+                    if status == 200:
+                        metrics.count('bytes_fetched', len(body))
+                        return body
+                    error = f'HTTP {status}'
+                    if status not in RETRY_STATUS:
+                        raise FetchError(f'{url}: {error}')
+            if attempt < self.retries:
+                wait = self.backoff * 2**attempt * random.uniform(1, 1.5)
+                if retry_after and retry_after.isdigit():
+                    wait = max(wait, int(retry_after))
+                log.debug(f'{url}: {error}, retry in {wait:.1f}s')
+                await asyncio.sleep(wait)
+        raise FetchError(f'{url}: {error} after {self.retries} retries')
+
+    async def fetch_all(self, dates):
+        '''
+        [(url, body or None)] of the dates, in order; the failures are
+        added to self.failed.
+        '''
+        limit = asyncio.Semaphore(self.concurrency)
+        urls = [self.url(d) for d in dates]
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            bodies = await asyncio.gather(
+                *(self.fetch(u, limit, executor) for u in urls),
+                return_exceptions=True)
+        found = []
+        for url, body in zip(urls, bodies):
+            if isinstance(body, Exception):
+                log.warning(f'fetch failed: {body}')
+                metrics.count('fetch_failed')
+                self.failed[url] = repr(body)
+                body = None
+            found.append((url, body))
+        return found
+
+    def pages(self, dates, batch=64):
+        '''
+        Yields (url, html) of the dates that could be fetched, batch dates
+        at a time, so the html of a year of dates is never all held in
+        memory. Feed it to ingest.scrape_stream (see
+        RecoverJackson.fetch_dates); nothing is written to disk.
+        '''
+        try:
+            for i in range(0, len(dates), batch):
+                for url, body in asyncio.run(
+                        self.fetch_all(dates[i:i + batch])):
+                    if body is not None:
+                        yield url, body
+        finally:
+            self.pool.close()
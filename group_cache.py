@@ -0,0 +1,188 @@
+# file: group_cache.py
+
+import csv
+import json
+import os
+
+
+class GroupCache:
+    '''
+    Lets group_by_fund() read only the rows appended to detailsByDate.csv
+    since its last run. The aggregate itself is groupByfund.json; next to
+    it the state file holds the csv byte offset that was consumed, the
+    csv inode and the bytes just before the offset. Appends keep the inode
+    and the tail, so the cached aggregate is extended from the offset. A
+    rewritten csv (upsert, rm, edit) fails the check and is grouped again
+    from byte 0. Between calls in one session the aggregate stays in
+    memory, so the json is not even read back. keep() moves it forward
+    in memory only, eg: for an ingest to look up the stored rows, and
+    unsaved tells that the files are behind it. snapshot, if set, is
+    called when nothing is in memory yet: it returns (version, aggregate)
+    of another copy of the aggregate that still covers the csv (see
+    covers), eg: the column store, or None. It is read instead of the
+    json, and the rows after its version are read from the csv.
+    '''
+    TAIL = 64
+
+    def __init__(self, csv_file, by_fund_file, state_file, GroupByFund):
+        self.csv_file = csv_file
+        self.by_fund_file = by_fund_file
+        self.state_file = state_file
+        self.GroupByFund = GroupByFund
+        self.snapshot = None
+        self.aggregate = None  # in memory, valid at self.state
+        self.state = None
+        self.unsaved = False
+
+    def read_state(self):
+        if self.state is None and os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as file:
+                self.state = json.load(file)
+        return self.state
+
+    def valid(self, state, st):
+        '''
+        True when the csv is the file state was taken from, grown or not.
+        '''
+        if state is None:
+            return False
+        if self.aggregate is None and not os.path.exists(self.by_fund_file):
+            return False
+        return self.covers([state['ino'], state['offset'], state['tail']], st)
+
+    def covers(self, version, st):
+        '''
+        True when version, [ino, offset, tail] (see version()), was taken
+        from the csv of stat st, grown or not.
+        '''
+        ino, offset, tail = version
+        return ino == st.st_ino and offset <= st.st_size \
+            and self.tail_hex(offset) == tail
+
+    def tail_hex(self, offset):
+        '''
+        hex of the TAIL bytes of the csv just before offset.
+        '''
+        start = max(0, offset - self.TAIL)
+        with open(self.csv_file, 'rb') as file:
+            file.seek(start)
+            return file.read(offset - start).hex()
+
+    def version(self):
+        '''
+        [ino, offset, tail] of the csv as it is now, as save() records
+        them: it changes whenever rows are appended or the csv is
+        rewritten, so it keys results computed from the rows, without
+        reading them.
+        '''
+        st = os.stat(self.csv_file)
+        offset = self.line_end(0, st.st_size)
+        return [st.st_ino, offset, self.tail_hex(offset)]
+
+    def load(self):
+        '''
+        Returns (groupbyfund, rows): the cached {fundId: GroupByFund} and
+        the csv rows appended since it was saved. rows is an empty list
+        when the csv did not change, else a generator that reads the rows
+        one line at a time, so a large csv is never held in memory; after
+        a rewrite groupbyfund is empty and rows are all of the csv.
+        '''
+        st = os.stat(self.csv_file)
+        state = self.read_state()
+        seed = None
+        if self.aggregate is None and self.snapshot is not None:
+            seed = self.snapshot()
+        valid = self.valid(state, st)
+        if seed is not None:
+            start, self.aggregate = seed[0][1], seed[1]
+        elif valid:
+            start = state['offset']
+            if self.aggregate is None:
+                self.aggregate = self.read_aggregate(state)
+        else:
+            start = 0
+            self.aggregate = dict()
+        # a row still being appended is left for the next call
+        self.offset = self.line_end(start, st.st_size)
+        self.ino = st.st_ino
+        if seed is not None:
+            # the json is written again unless it holds the same rows
+            self.unsaved = not (valid and state['offset'] == self.offset)
+        if self.offset == start:
+            return self.aggregate, []
+        return self.aggregate, self.rows(start, self.offset)
+
+    def read_aggregate(self, state):
+        '''
+        the {fundId: GroupByFund} of by_fund_file, which state is valid for.
+        '''
+        with open(self.by_fund_file, 'r') as json_file:
+            cached = json.load(json_file)
+        return {int(k): self.GroupByFund(*v) for k, v in cached.items()}
+
+    def line_end(self, start, size):
+        '''
+        offset just after the last newline between start and size.
+        '''
+        with open(self.csv_file, 'rb') as file:
+            end = size
+            while end > start:
+                block = max(start, end - 4096)
+                file.seek(block)
+                i = file.read(end - block).rfind(b'\n')
+                if i >= 0:
+                    return block + i + 1
+                end = block
+        return start
+
+    def rows(self, start, end):
+        '''
+        Yields the csv rows between the byte offsets start and end.
+        '''
+        with open(self.csv_file, 'rb') as file:
+            file.seek(start)
+
+            def lines():
+                pos = start
+                while pos < end:
+                    line = file.readline()
+                    if not line:
+                        return
+                    pos += len(line)
+                    yield line.decode('utf-8')
+            yield from csv.reader(lines())
+
+    def keep(self, **fields):
+        '''
+        Record that the aggregate in memory holds the csv up to
+        self.offset, without saving it: the files keep what they held.
+        '''
+        self.state = {'ino': self.ino, 'offset': self.offset,
+                      'tail': self.tail_hex(self.offset), **fields}
+        self.unsaved = True
+
+    def save(self, **fields):
+        '''
+        Record that groupByfund.json now holds the csv up to self.offset.
+        fields are saved in the state file too.
+        '''
+        self.keep(**fields)
+        self.unsaved = False
+        tmp = f'{self.state_file}.tmp'
+        with open(tmp, 'w') as file:
+            file.write(json.dumps(self.state) + '\n')
+        os.replace(tmp, self.state_file)
+
+
+def slice_groups(groupbyfund, start=None, end=None):
+    '''
+    {fundId: GroupByFund} holding only the dates between the isodates start
+    and end (inclusive, None is unbounded). The days of each fund are a
+    sorted index, so the bounds are found by bisection (GroupByFund.index).
+    '''
+    sliced = dict()
+    for fid, g in groupbyfund.items():
+        i, j = g.index(start, end)
+        if i < j:
+            sliced[fid] = g.slice(i, j)
+    return sliced
@@ -0,0 +1,375 @@
+# file: ingest.py
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import chain
+import gc
+import os
+import time
+import archive
+from manifest import IngestManifest
+from batch_writer import CsvBatchWriter
+from metrics import log, metrics, peak_rss_mb, rss_mb
+
+# pages parsed and committed per batch, see Budget
+BATCH = 256
+
+
+def read_one(reader, file, html=None):
+    '''
+    Runs in a worker process. reader is a pickled RecoverJackson or
+    ScrapeSavePlot, so it carries its own dirs, parser and lookupfund.
+    html is the page's bytes when it was read from an archive.
+    Returns (jfs, stats): stats is the page's parse time, rows and the
+    counts read_page made (bytes_read, unknown_fund), to be merged in the
+    parent process.
+    '''
+    t = time.perf_counter()
+    with metrics.scope() as counts:
+        jfs = reader.read_page(file) if html is None \
+            else reader.read_html(html)
+    stats = {'seconds': round(time.perf_counter() - t, 6), 'rows': len(jfs),
+             **counts}
+    return jfs, stats
+
+
+def read_pages(reader, files, workers=1, html=None, pool=None):
+    '''
+    Calls reader.read_page(file) for each file, in a pool of worker
+    processes when workers > 1 (pool, if given, else a new one), otherwise
+    in this process. html is {file: bytes} of pages read from an archive
+    or fetched, parsed by read_html.
+    Returns (pages, failed) where pages is a list of (file, [JacksonFund])
+    sorted by the date parsed from the page (then file name), and failed is
+    a dict {file: error} of pages that raised. One bad page is reported and
+    does not stop the others. A page event with its parse time, bytes and
+    rows is added to metrics for every page read.
+    '''
+    pages = []
+    failed = dict()
+    html = html or dict()
+    results = []
+    if workers > 1 and len(files) > 1:
+        with nullcontext(pool) if pool else \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(f, pool.submit(read_one, reader, f, html.get(f)))
+                       for f in files]
+            for file, future in futures:
+                try:
+                    results.append((file, future.result()))
+                except Exception as err:
+                    failed[file] = repr(err)
+    else:
+        for file in files:
+            try:
+                results.append((file, read_one(reader, file,
+                                               html.get(file))))
+            except Exception as err:
+                failed[file] = repr(err)
+    for file, (jfs, stats) in results:
+        pages.append((file, jfs))
+        metrics.event('page', file=file, **stats)
+        metrics.merge({k: v for k, v in stats.items() if k != 'seconds'})
+        metrics.count('pages')
+    for file, err in failed.items():
+        log.warning(f'{file} failed: {err}')
+        metrics.count('failed_pages')
+    sort_pages(pages)
+    return pages, failed
+
+
+def sort_pages(pages):
+    # the first record of a page is the JacksonFunds total, dated by the page
+    pages.sort(key=lambda page: (page[1][0].day if page[1] else 0, page[0]))
+
+
+def merge_rows(pages, stored=None):
+    '''
+    The rows of pages, [(file, [JacksonFund])], with one row per
+    (fundId, date), in date order, without the rows already stored.
+    A page's own rows are those of its selected date, the date of its
+    first row; any other rows, eg: today's column of a values page, are
+    copies that every page saved on the same day holds. Own rows win over
+    copies, and two rows of one key that disagree are counted as
+    inconsistent_rows and reported, keeping the first. Duplicates are
+    counted as merged_rows.
+    stored is {(fundId, isodate): value} of the rows already stored for
+    the pages' dates. A row of a stored key with the same value is left
+    out (unchanged_rows), so it is neither written nor makes the csv be
+    rewritten; an own row with another value replaces the stored row (a
+    re-saved page, replaced_rows) and a copy with another value is
+    reported as inconsistent and left out, the stored row stays.
+    '''
+    stored = stored or dict()
+    merged = dict()
+    for own in (True, False):
+        for file, page in pages:
+            for jf in page:
+                if (jf.day == page[0].day) != own:
+                    continue
+                key = (jf.fundId, jf.day)
+                first = merged.get(key)
+                if first is None:
+                    old = stored.get((jf.fundId, jf.date))
+                    if old is None:
+                        merged[key] = jf
+                    elif old == jf.value:
+                        metrics.count('unchanged_rows')
+                    elif own:
+                        metrics.count('replaced_rows')
+                        merged[key] = jf
+                    else:
+                        metrics.count('inconsistent_rows')
+                        log.warning(f'{file}: fund {jf.fundId} on {jf.date}'
+                                    f' is {jf.value}, the stored row has '
+                                    f'{old}')
+                    continue
+                metrics.count('merged_rows')
+                if first != jf:
+                    metrics.count('inconsistent_rows')
+                    log.warning(f'{file}: fund {jf.fundId} on {jf.date} '
+                                f'is {jf.value}, another page has '
+                                f'{first.value}')
+    return sorted(merged.values(), key=lambda jf: jf.day)
+
+
+class Budget:
+    '''
+    How many pages are parsed and committed per batch. Rows of a batch are
+    written before the next batch is read, so memory does not grow with
+    the number of pages. max_mb is a ceiling on the resident memory of
+    this process (None: no ceiling): while a batch leaves it above max_mb,
+    garbage is collected and the batches are halved, down to one page per
+    worker.
+    '''
+
+    def __init__(self, pages=BATCH, max_mb=None, workers=1):
+        self.least = max(workers, 1)
+        self.pages = max(pages, self.least)
+        self.max_mb = max_mb
+
+    def check(self):
+        if self.max_mb and rss_mb() > self.max_mb:
+            gc.collect()
+            rss = rss_mb()
+            if rss > self.max_mb and self.pages > self.least:
+                self.pages = max(self.least, self.pages // 2)
+                metrics.count('batch_shrunk')
+                log.warning(f'{rss:.0f} MB resident, above the {self.max_mb}'
+                            f' MB ceiling: {self.pages} pages per batch now')
+
+
+def make_budget(reader, workers):
+    '''
+    the Budget of reader.ingest_batch pages and reader.memory_mb.
+    '''
+    return Budget(getattr(reader, 'ingest_batch', BATCH),
+                  getattr(reader, 'memory_mb', None), workers)
+
+
+def worker_pool(workers):
+    '''
+    one pool of worker processes for all the batches of an ingest.
+    '''
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 \
+        else nullcontext()
+
+
+def file_batches(reader, files, workers, budget, pool=None):
+    '''
+    Yields read_pages (pages, failed) of files, budget.pages at a time.
+    '''
+    i = 0
+    while i < len(files):
+        chunk = files[i:i + budget.pages]
+        i += len(chunk)
+        yield read_pages(reader, chunk, workers, None, pool)
+
+
+def read_stream(reader, manifest, items, workers=1, source=None,
+                budget=None, pool=None):
+    '''
+    Yields read_pages (pages, failed) for a stream of (name, html bytes),
+    eg: the pages of an archive (see archive.py) or pages fetched over http
+    (see fetch.py), without writing them to disk: at most budget.pages
+    pages are held in memory and parsed at a time. Pages byte-identical to
+    a page already recorded in manifest, eg: the same day saved twice or in
+    two archives, are skipped (see manifest.fresh). If the stream itself
+    raises, eg: a corrupt archive, the pages read so far are kept and
+    source fails.
+    '''
+    budget = budget or Budget(workers=workers)
+    batch = dict()
+    failed = dict()
+    try:
+        for name, html in items:
+            if manifest.fresh(name, html):
+                batch[name] = html
+            if len(batch) >= budget.pages:
+                yield read_pages(reader, list(batch), workers, batch, pool)
+                batch = dict()
+    except Exception as err:
+        log.warning(f'{source} failed: {err!r}')
+        metrics.count('failed_sources')
+        failed[source] = repr(err)
+    pages, bad = read_pages(reader, list(batch), workers, batch, pool)
+    bad.update(failed)
+    yield pages, bad
+
+
+def open_store(reader, manifest_file, rebuild=False):
+    '''
+    (manifest, out) for an ingest into reader.csv_file, or into
+    reader.db_file with the sqlite backend: out is the CsvBatchWriter or
+    the SqlStore. If the csv file (database) is missing the manifest is
+    reset, so all pages are scraped again; rebuild removes it first.
+    '''
+    if rebuild:
+        stored = reader.db_file if reader.backend == 'sqlite' \
+            else reader.csv_file
+        if os.path.exists(stored):
+            os.remove(stored)
+    manifest = IngestManifest(manifest_file)
+    if reader.backend == 'sqlite':
+        if not os.path.exists(reader.db_file):
+            manifest.reset()
+        return manifest, reader.sql_store()
+    # finishes an interrupted append before we look at the csv file
+    writer = CsvBatchWriter(reader.csv_file)
+    if not os.path.exists(reader.csv_file):
+        manifest.reset()
+    return manifest, writer
+
+
+def commit(reader, manifest, out, pages):
+    '''
+    Upserts the rows of pages by (fundId, date) in one atomic commit
+    (CsvBatchWriter or one sqlite transaction) and records the pages in
+    the manifest, which is saved. Returns the number of rows written.
+    The keys already stored are looked up in the stored rows of the
+    pages' dates, not in the manifest, so a csv (database) kept without
+    its manifest, or holding rows of pages no longer recorded, does not
+    get their rows again. Rows equal to the stored ones are left out (see
+    merge_rows), so the csv is only rewritten when a value changed and
+    the caches kept on it (GroupCache, running statistics, rollups) stay
+    valid through a backfill.
+    '''
+    dates = {jf.date for file, page in pages for jf in page}
+    if reader.backend == 'sqlite':
+        stored = out.values(dates)
+    else:
+        stored = reader.stored_values(dates)
+    jfs = merge_rows(pages, stored)
+    if reader.backend == 'sqlite':
+        out.upsert(jfs)
+    else:
+        out.extend(jfs)
+        out.upsert(stored)
+    for file, page in pages:
+        if page:
+            manifest.record(file, page[0].date, page[-1].date)
+    manifest.save()
+    return len(jfs)
+
+
+def commit_batches(reader, manifest, out, batches, budget):
+    '''
+    commit() each (pages, failed) of batches as it comes, so only one
+    batch of pages and rows is in memory, then checks the budget.
+    Returns (pages, rows, failed): the pages and rows written and
+    {file: error} of all batches.
+    '''
+    n_pages = n_rows = 0
+    failed = dict()
+    for pages, bad in batches:
+        failed.update(bad)
+        n_rows += commit(reader, manifest, out, pages)
+        n_pages += len(pages)
+        pages = None  # let the batch go before the next one is read
+        budget.check()
+    return n_pages, n_rows, failed
+
+
+def finish(reader, out, n_pages, rebuild=False):
+    '''
+    closes out and, with the csv backend, updates the running statistics
+    and the rollups from the rows written, which costs O(new rows); trims
+    the page cache. The column store is a full pass over the csv, so it
+    is built again with rebuild, after the csv was rewritten, or once the
+    csv grew by 1/colstore.SLACK past it (see store_stale): over many
+    ingests that costs about SLACK times the rows written.
+    '''
+    if reader.backend == 'sqlite':
+        out.close()
+    elif n_pages:
+        if rebuild or reader.store_stale():
+            reader.save_store()
+        reader.update_stats()
+        reader.update_rollups()
+    if reader.page_cache is not None:
+        reader.page_cache.evict()
+
+
+def scrape(reader, directory, files, workers, manifest_file, rebuild=False):
+    '''
+    Incremental scrape of files in directory into reader.csv_file, or into
+    reader.db_file with the sqlite backend. Only the files that
+    manifest_file does not already hold, or whose content changed, are
+    parsed. Pages are read and committed in batches (see Budget and
+    commit()), so tens of thousands of pages are scraped in bounded
+    memory, and an interrupted scrape keeps the batches it committed.
+    If the csv file (database) is missing the manifest is reset and all
+    files are scraped again; rebuild removes it first, eg: after a
+    lookupfund change, when the pages come from the page cache.
+    files may be archives of pages (.html.gz, .zip, tar), see
+    read_stream; an archive is skipped as a whole while it is unchanged.
+    Returns {file: error} of pages that failed.
+    '''
+    with metrics.stage('ingest', files=len(files)) as st:
+        manifest, out = open_store(reader, manifest_file, rebuild)
+        todo = manifest.changed(directory, files)
+        plain = [f for f in todo if not archive.is_packed(f)]
+        packed = [f for f in todo if archive.is_packed(f)]
+        bgt = make_budget(reader, workers)
+        with worker_pool(workers) as pool:
+            batches = chain(
+                file_batches(reader, plain, workers, bgt, pool),
+                *(read_stream(reader, manifest,
+                              archive.pages(os.path.join(directory, f)),
+                              workers, f, bgt, pool) for f in packed))
+            n_pages, n_rows, failed = commit_batches(reader, manifest, out,
+                                                     batches, bgt)
+        for file in packed:
+            if not any(f == file or f.startswith(f'{file}!') for f in failed):
+                manifest.record(file, '')
+        manifest.save()
+        finish(reader, out, n_pages, rebuild)
+        st.update(pages=n_pages, rows=n_rows, failed=len(failed),
+                  batch_pages=bgt.pages,
+                  workers_peak_rss_mb=round(peak_rss_mb(True), 1))
+        log.info(f'{n_pages} pages of {len(files)} files scraped, '
+                 f'{len(failed)} failed, peak rss {peak_rss_mb():.0f} MB')
+    return failed
+
+
+def scrape_stream(reader, items, workers, manifest_file, source='stream'):
+    '''
+    Incremental scrape of a stream of (name, html bytes), eg: pages
+    fetched over http (see fetch.py), as scrape() does for files: pages
+    already recorded in manifest_file, by the sha256 of their html, are
+    not parsed again. Returns {name: error} of pages that failed.
+    '''
+    with metrics.stage('ingest', source=source) as st:
+        manifest, out = open_store(reader, manifest_file)
+        bgt = make_budget(reader, workers)
+        with worker_pool(workers) as pool:
+            n_pages, n_rows, failed = commit_batches(
+                reader, manifest, out,
+                read_stream(reader, manifest, items, workers, source, bgt,
+                            pool), bgt)
+        finish(reader, out, n_pages)
+        st.update(pages=n_pages, rows=n_rows, failed=len(failed),
+                  batch_pages=bgt.pages)
+        log.info(f'{n_pages} pages of {source} scraped, '
+                 f'{len(failed)} failed, peak rss {peak_rss_mb():.0f} MB')
+    return failed
@@ -0,0 +1,296 @@
+# file: jackson.py
+'''
+Command line for cron jobs and shell pipelines, eg:
+    python -m jackson ingest recover/       # or files: recover/sep30.html
+    python -m jackson ingest 2022.tar.gz    # or .zip, .html.gz, unextracted
+    python -m jackson group
+    python -m jackson rank --window 5 --start 2022-09-12
+    python -m jackson plot --out funds.png
+    python -m jackson render --dir charts --format svg
+    python -m jackson gaps --start 2022-09-01
+    python -m jackson summary --period all  # default year to date
+    python -m jackson corr --window 20 --out corr.json
+    python -m jackson ingest --rebuild      # after a funds.json change
+    python -m jackson cache stats           # or: cache clear, cache evict
+    python -m jackson watch                 # ingest pages as they are saved
+    python -m jackson fetch --start 2022-01-03 --end 2022-12-30
+--source scrape works on the details pages of ScrapeSavePlot (data/)
+instead of the values pages of RecoverJackson (recover/); fetch always
+reads values pages. --account NAME works on another account of funds.json,
+whose pages and files are in recover/NAME/ (or data/NAME/).
+Each subcommand imports only what it needs: rank and corr never load
+matplotlib, group never loads bs4 (numpy only to read the column store).
+--log-level DEBUG echoes every row, -q only reports failures, and
+--metrics FILE appends the run's timings and counters as json lines.
+'''
+
+import argparse
+import os
+import sys
+
+
+def make_reader(args):
+    '''
+    RecoverJackson or ScrapeSavePlot, as selected by --source.
+    '''
+    if args.source == 'scrape':
+        from scrape_jackson import ScrapeSavePlot
+        return ScrapeSavePlot(getattr(args, 'parser', None), args.backend,
+                              args.account)
+    from recover import RecoverJackson
+    return RecoverJackson(getattr(args, 'parser', None), args.backend,
+                          args.account)
+
+
+def html_files(paths):
+    '''
+    {directory: [file, ...]} of the html files named by paths, which are
+    html files, archives of them (.html.gz, .zip, .tar.gz) or directories
+    holding them.
+    '''
+    from archive import is_source
+    by_dir = dict()
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            files = sorted(f for f in os.listdir(path) if is_source(f))
+            by_dir.setdefault(path, []).extend(files)
+        else:
+            d, f = os.path.split(path)
+            by_dir.setdefault(d, []).append(f)
+    return by_dir
+
+
+def ingest(args):
+    reader = make_reader(args)
+    default = reader.recover_dir if args.source == 'recover' \
+        else reader.data_dir
+    failed = dict()
+    for d, files in html_files(args.paths or [default]).items():
+        failed.update(reader.scrape_files(d, files, args.workers,
+                                          args.rebuild))
+    return 1 if failed else 0
+
+
+def fetch(args):
+    from recover import RecoverJackson
+    import recover_spt as spt
+    import fetch as fetcher
+    reader = RecoverJackson(None, args.backend, args.account)
+    if not args.dates and not args.start:
+        print('give the dates, or --start (and --end)')
+        return 2
+    dates = args.dates or fetcher.trading_days(args.start,
+                                               args.end or args.start)
+    f = fetcher.Fetcher(args.base_url or spt.fetch_base_url,
+                        args.path or spt.fetch_path,
+                        args.concurrency or spt.fetch_concurrency,
+                        args.rate or spt.fetch_rate, spt.fetch_retries,
+                        headers=spt.fetch_headers)
+    failed = reader.fetch_dates(dates, args.workers, f)
+    return 1 if failed else 0
+
+
+def watch(args):
+    reader = make_reader(args)
+    if args.source == 'scrape':
+        import scrape_spt as spt
+        default = reader.data_dir
+    else:
+        import recover_spt as spt
+        default = reader.recover_dir
+    import watch as watcher
+    watcher.watch(reader, os.path.abspath(args.dir or default), args.workers,
+                  args.rank_out or reader.rank_file,
+                  spt.watch_settle if args.settle is None else args.settle,
+                  spt.watch_interval if args.interval is None
+                  else args.interval, args.poll, args.once, args.metrics)
+    return 0
+
+
+def group(args):
+    reader = make_reader(args)
+    reader.group_by_fund(args.start, args.end)
+    return 0
+
+
+def rank(args):
+    reader = make_reader(args)
+    reader.rank_funds(args.window, args.start, args.end, args.out)
+    return 0
+
+
+def corr(args):
+    reader = make_reader(args)
+    reader.correlate(args.window, args.start, args.end, args.out)
+    return 0
+
+
+def plot(args):
+    reader = make_reader(args)
+    reader.plot_normalized(args.start, args.end, args.out)
+    return 0
+
+
+def render(args):
+    reader = make_reader(args)
+    for path in reader.render_charts(args.dir, args.format, args.start,
+                                     args.end):
+        print(path)
+    return 0
+
+
+def gaps(args):
+    reader = make_reader(args)
+    for fid, missing in reader.find_gaps(args.start, args.end).items():
+        print(f'jf{fid}: {" ".join(missing)}')
+    return 0
+
+
+def summary(args):
+    reader = make_reader(args)
+    names = reader.account.names()
+    for fid, bar in sorted(reader.summary(args.period).items()):
+        print(f'jf{fid} {names.get(fid, "")}: {bar["start"] or "inception"}'
+              f' to {bar["end"]} ({bar["n"]} days) nvalue open '
+              f'{bar["nopen"]} close {bar["nclose"]} min {bar["nmin"]} max '
+              f'{bar["nmax"]} mean {bar["nmean"]:.3f}, value close '
+              f'{bar["vclose"]:.2f}')
+    return 0
+
+
+def cache(args):
+    reader = make_reader(args)
+    if reader.page_cache is None:
+        print('the page cache is turned off (page_cache_dir)')
+        return 1
+    if args.action == 'clear':
+        print(f'{reader.page_cache.invalidate(args.tag)} entries removed')
+    elif args.action == 'evict':
+        print(f'{reader.page_cache.evict()} entries removed')
+    print(reader.page_cache.stats())
+    return 0
+
+
+def main(argv=None):
+    import layouts
+    ap = argparse.ArgumentParser(prog='python -m jackson',
+                                 description='Scrape, group, rank and plot '
+                                 'Jackson subaccount values.')
+    ap.add_argument('--source', choices=('recover', 'scrape'),
+                    default='recover',
+                    help='values pages (recover/) or details pages (data/)')
+    ap.add_argument('--backend', choices=('csv', 'sqlite'), default=None,
+                    help='where rows are stored, default from the spt file')
+    ap.add_argument('--account', default=None,
+                    help='account of funds.json to work on, default its '
+                    'default account')
+    ap.add_argument('--log-level', default='INFO',
+                    choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                    help='DEBUG also echoes every row and cell')
+    ap.add_argument('-q', '--quiet', action='store_true',
+                    help='same as --log-level WARNING')
+    ap.add_argument('--metrics', metavar='FILE',
+                    help='append stage timings, page stats and counters to '
+                    'FILE as json lines')
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('ingest', help='scrape html pages into the csv/db')
+    p.add_argument('paths', nargs='*',
+                   help='html files, archives of them (.html.gz, .zip, '
+                   '.tar.gz) or directories, default the source dir')
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--parser', choices=('lxml', 'html.parser', 'html5lib'),
+                   default=None)
+    p.add_argument('--rebuild', action='store_true',
+                   help='scrape every page into a new csv/db, eg: after a '
+                   'funds.json change (pages come from the page cache)')
+    p.set_defaults(run=ingest)
+
+    p = sub.add_parser('fetch', help='fetch the values pages of dates over '
+                       'http and scrape them, nothing saved to disk')
+    p.add_argument('dates', nargs='*', help='isodates, or use --start/--end')
+    p.add_argument('--start', help='first isodate of a range of trading days')
+    p.add_argument('--end', help='last isodate, default --start')
+    p.add_argument('--base-url', help='default spt.fetch_base_url')
+    p.add_argument('--path', help="page path, eg: '{mmm}{dd}.html'")
+    p.add_argument('--concurrency', type=int, default=None)
+    p.add_argument('--rate', type=float, default=None,
+                   help='requests per second')
+    p.add_argument('--workers', type=int, default=None)
+    p.set_defaults(run=fetch)
+
+    p = sub.add_parser('watch', help='ingest pages as they are saved and '
+                       'keep groupByfund.json and the ranking up to date')
+    p.add_argument('dir', nargs='?', help='default the source dir')
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--rank-out', metavar='FILE',
+                   help='ranking json written after each update, default '
+                   'ranked.json in the source dir')
+    p.add_argument('--settle', type=float, default=None,
+                   help='seconds a page must stay unchanged before reading')
+    p.add_argument('--interval', type=float, default=None,
+                   help='seconds between scans when polling')
+    p.add_argument('--poll', action='store_true',
+                   help='scan the directory instead of using inotify')
+    p.add_argument('--once', action='store_true',
+                   help='stop after the first update')
+    p.set_defaults(run=watch, parser=None)
+
+    p = sub.add_parser('summary', help='open, close, min, max and mean of '
+                       'every fund over the year to date or another period')
+    p.add_argument('--period', default='year',
+                   choices=('week', 'month', 'quarter', 'year', 'all'),
+                   help='the current week, month, quarter, the year to date '
+                   'or all since inception')
+    p.set_defaults(run=summary)
+
+    p = sub.add_parser('cache', help='page cache: stats, clear or evict')
+    p.add_argument('action', choices=('stats', 'clear', 'evict'))
+    p.add_argument('--tag', help='clear only entries of this tag, eg: '
+                   f'{layouts.VALUES.tag}.{layouts.VALUES.version}')
+    p.set_defaults(run=cache)
+
+    for name, run, hlp in (('group', group, 'write groupByfund.json'),
+                           ('rank', rank, 'print the ranked subaccounts'),
+                           ('corr', corr, 'print the correlation of the '
+                            'daily returns of every pair of funds'),
+                           ('plot', plot, 'plot normalized values'),
+                           ('render', render, 'write the portfolio chart and '
+                            'one chart per fund, no display needed'),
+                           ('gaps', gaps, 'list the trading days with no '
+                            'row')):
+        p = sub.add_parser(name, help=hlp)
+        p.add_argument('--start', help='first isodate, eg: 2022-09-01')
+        p.add_argument('--end', help='last isodate')
+        p.set_defaults(run=run)
+        if name == 'rank':
+            p.add_argument('--window', type=int, default=None)
+            p.add_argument('--out', help='write the table to this json '
+                           'file instead of printing it')
+        if name == 'corr':
+            p.add_argument('--window', type=int, default=None,
+                           help='dates in the rolling window')
+            p.add_argument('--out', help='write the matrices to this json '
+                           'file instead of printing them')
+        if name == 'plot':
+            p.add_argument('--out', help='save to this png/svg file instead '
+                           'of showing a window')
+        if name == 'render':
+            p.add_argument('--dir', help='output directory, default '
+                           'charts/ in the source dir')
+            p.add_argument('--format', choices=('png', 'svg'), default='png')
+
+    args = ap.parse_args(argv)
+    from metrics import setup, metrics
+    setup('WARNING' if args.quiet else args.log_level)
+    try:
+        return args.run(args)
+    finally:
+        if args.metrics:
+            metrics.event('run', command=args.command, source=args.source)
+            metrics.export(args.metrics)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# file: layouts.py
+
+import re
+from metrics import log, metrics
+from records import JacksonFund
+
+# detect() only looks at this much of a page for the layout markers
+SNIFF = 128 * 1024
+
+
+def mdy_iso(date):
+    '''
+    jackson formats dates as mm/dd/yyyy eg: 08/18/2022, iso as yyyy-mm-dd
+    eg: 2022-08-18. An isodate is returned as it is.
+    '''
+    if '/' in date:
+        mdy = date.split('/')
+        return f'{mdy[2]}-{mdy[0]}-{mdy[1]}'
+    return date
+
+
+def money(text):
+    '''
+    '$59,275.76' -> 59275.76
+    '''
+    return float(text.strip()[1:].replace(',', ''))
+
+
+class Layout:
+    '''
+    How one kind of saved page is read. ids are the elements lxml and
+    html.parser build (a SoupStrainer, compiled once per process), extract()
+    takes their texts out of the soup, and join() turns those texts and an
+    account (see registry.py) into JacksonFund rows. The subaccount grid
+    has stride cells per fund; the offsets of its fields are class
+    attributes, so no cell position is spelled out in the loops.
+    marker is a byte string that only pages of this layout hold, which
+    detect() looks for in the first SNIFF bytes instead of parsing.
+    tag and version name the extractor in the page cache: bump version
+    when extract() changes.
+    '''
+    name = None
+    tag = None
+    version = 1
+    marker = None
+    ids = ()
+    stride = 7
+
+    def __init__(self):
+        self.only = None
+
+    def strainer(self):
+        if self.only is None:
+            from bs4 import SoupStrainer
+            self.only = SoupStrainer(id=self.ids)
+        return self.only
+
+    def make_soup(self, html, parser):
+        '''
+        Parse html with parser. lxml and html.parser are restricted to the
+        elements of ids, so nothing else on the page is built. html5lib
+        ignores parse_only and builds the whole page; it is kept for
+        comparison with older runs.
+        '''
+        from bs4 import BeautifulSoup
+        if parser == 'html5lib':
+            return BeautifulSoup(html, 'html5lib')
+        return BeautifulSoup(html, parser, parse_only=self.strainer())
+
+    def cache_tag(self, parser):
+        return f'{self.tag}.{self.version}.{parser}'
+
+    def extract_html(self, html, parser):
+        '''
+        the texts of the page html (bytes) as extract() returns them.
+        '''
+        soup = self.make_soup(html.decode('utf-8'), parser)
+        try:
+            return self.extract(soup)
+        finally:
+            # the tree is full of parent/child cycles; free it now, not at
+            # the next garbage collection
+            soup.decompose()
+
+    def rows(self, cells):
+        '''
+        index of the first cell of every complete grid row of cells.
+        '''
+        return range(0, len(cells) - self.stride + 1, self.stride)
+
+    def lookup(self, account, text, date):
+        '''
+        FundInfo of the fund named text on date, or None (counted as
+        unknown_fund).
+        '''
+        info = account.lookup(text, date)
+        if info is None:
+            metrics.count('unknown_fund')
+            log.debug('unknown fund %s', text)
+        else:
+            log.debug('%s  %s', date, text)
+        return info
+
+    def extract(self, soup):
+        raise NotImplementedError
+
+    def join(self, raw, account, today_rows=True):
+        raise NotImplementedError
+
+
+class ValuesLayout(Layout):
+    '''
+    The values dialog that RecoverJackson reads (recover/): a summary
+    table whose headers and totals are those of the selected date and of
+    today's date, and the subaccount grid, 7 cells a fund: its name, then
+    num_units, unit_value and value of the selected date (column 0), then
+    of today's date (column 3).
+    '''
+    name = 'values'
+    tag = 'RecoverJackson'
+    version = 2
+    dialog_id = 'dialogForm:valueAsOfDateDialog'
+    grid_id = 'dialogForm:valueAsOfSubaccountTable'
+    marker = b'id="dialogForm:valueAsOfSubaccountTable"'
+    ids = dialog_id
+    NAME, UNITS, UNIT_VALUE, VALUE = 0, 1, 2, 3
+    SELECTED, TODAY = 0, 3
+
+    def extract(self, soup):
+        '''
+        {'date': summary header, 'total': total contract value,
+         'today': header of today's column, 'today_total': its total,
+         'cells': [<td> text of the subaccount grid]}
+        '''
+        # the summary table is the first table in the values dialog
+        dialog = soup.find(id=self.dialog_id)
+        tbl = dialog.find('table')
+        ths = tbl.find_all('th')
+        tds = tbl.find_all('td')
+        grid = dialog.find(id=self.grid_id)
+        return {'date': ths[1].get_text(), 'total': tds[1].get_text(),
+                'today': ths[2].get_text(), 'today_total': tds[2].get_text(),
+                'cells': [td.get_text() for td in grid.find_all('td')]}
+
+    def join(self, raw, account, today_rows=True):
+        '''
+        the rows of the selected date, then, with today_rows, the rows of
+        today's date. Each set starts with its JacksonFunds total.
+        '''
+        jfs = self.join_column(raw['date'], raw['total'], raw['cells'],
+                               account, self.SELECTED)
+        if today_rows:
+            jfs.extend(self.join_column(raw['today'], raw['today_total'],
+                                        raw['cells'], account, self.TODAY))
+        return jfs
+
+    def join_column(self, header, total, cells, account, col):
+        '''
+        The rows of one date column: header is the column's 'Value As of
+        mm/dd/yyyy', total its total contract value and col its offset in
+        the grid rows.
+        '''
+        dt = mdy_iso(header[11:].strip())
+        total = round(money(total), 3)
+        fund = account.total
+        units = fund.units_of(self.name)
+        invested = fund.at(dt).invested
+        nv = round(total / invested, 3)  # normalized value
+        # num_units is summed over all subaccounts by Garth
+        jfs = [JacksonFund(fund.fundId, fund.key, invested, '100%', '100%',
+                           f'{round(nv*100)}%', units,
+                           round(total / units, 3), total, nv, dt)]
+        for i in self.rows(cells):
+            info = self.lookup(account, cells[i + self.NAME], dt)
+            if info is None:
+                continue
+            value = money(cells[i + col + self.VALUE])
+            jfs.append(JacksonFund(
+                info.fundId, cells[i + self.NAME].replace(' ', ''),
+                info.invested, info.allocated, info.allocated,
+                f'{round(value / invested*100)}%',
+                float(cells[i + col + self.UNITS].replace(',', '')),
+                float(cells[i + col + self.UNIT_VALUE].replace(',', '')),
+                value, round(value / info.invested, 3), dt))
+        return jfs
+
+
+class DetailsLayout(Layout):
+    '''
+    The details page that ScrapeSavePlot reads (data/): the date picker,
+    the additional details panel (deposited, death benefit, accumulation
+    and cash surrender amounts) and the asset allocation grid, 7 cells a
+    fund: a blank, name, actual%, future%, num_units, unit_value, value.
+    '''
+    name = 'details'
+    tag = 'ScrapeSavePlot'
+    version = 1
+    date_id = 'policyDetailsForm:valueAsOfDate_input'
+    details_id = 'policyDetailsForm:addlDetailsPanel'
+    grid_id = 'dialogForm:assetAllocation_dataTable_data'
+    marker = b'id="policyDetailsForm:addlDetailsPanel"'
+    ids = [date_id, details_id, grid_id]
+    NAME, ACTUAL, FUTURE, UNITS, UNIT_VALUE, VALUE = 1, 2, 3, 4, 5, 6
+    amounts = re.compile(r'\d{2},\d{3}.\d{2}')
+
+    def extract(self, soup):
+        '''
+        {'date': mm/dd/yyyy of the date picker, 'details': text of the
+         additional details panel, 'cells': [gridcell text of the asset
+         allocation table]}
+        '''
+        dt = soup.find(id=self.date_id)
+        acc = soup.find(id=self.details_id)
+        grid = soup.find(id=self.grid_id)
+        return {'date': str(dt)[-13:-3], 'details': acc.get_text(),
+                'cells': [gc.get_text()
+                          for gc in grid.find_all(role='gridcell')]}
+
+    def join(self, raw, account, today_rows=True):
+        '''
+        the JacksonFunds total of the details panel, then the funds of the
+        grid. A details page has one date, so today_rows does not apply.
+        '''
+        date = mdy_iso(raw['date'])
+        # create list of amounts: Deposited, DeathBenefit, Accum, CashSurrender
+        values = self.amounts.findall(raw['details'])
+        invested = float(values[0].replace(',', ''))
+        accum = float(values[2].replace(',', ''))
+        normalized = round(accum / invested, 3)
+        fund = account.total
+        units = fund.units_of(self.name)
+        jfs = [JacksonFund(fund.fundId, fund.key, invested, '100%', '100%',
+                           f'{round(100 * normalized, 2)}%', units,
+                           round(invested / units, 3), accum,
+                           normalized, date)]
+        cells = raw['cells']
+        for n in self.rows(cells):
+            name = cells[n + self.NAME]
+            info = self.lookup(account, name, date)
+            if info is None:
+                continue
+            value = money(cells[n + self.VALUE])
+            jfs.append(JacksonFund(
+                info.fundId, name, info.invested, info.allocated,
+                cells[n + self.FUTURE], cells[n + self.ACTUAL],
+                float(cells[n + self.UNITS]),
+                float(cells[n + self.UNIT_VALUE]), value,
+                round(value / info.invested, 3), date))
+        return jfs
+
+
+VALUES = ValuesLayout()
+DETAILS = DetailsLayout()
+# most specific first: a values page is a details page with the values
+# dialog open, so it holds the details markers too.
+LAYOUTS = {layout.name: layout for layout in (VALUES, DETAILS)}
+
+
+def detect(html, default=None):
+    '''
+    The Layout of the page html (bytes), from the first SNIFF bytes, or
+    default when no marker is found there.
+    '''
+    for layout in LAYOUTS.values():
+        if html.find(layout.marker, 0, SNIFF) >= 0:
+            return layout
+    return default
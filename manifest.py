@@ -0,0 +1,125 @@
+# file: manifest.py
+
+import hashlib
+import json
+import os
+from metrics import metrics
+
+
+def file_sha(path):
+    '''
+    sha256 of the file at path, read in 1 MB blocks, so archives of many
+    pages are hashed in bounded memory.
+    '''
+    h = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IngestManifest:
+    '''
+    Remembers which html pages have already been scraped into the csv file,
+    so scrape_many_html / scrape_all_html only parse new or re-saved pages.
+    The manifest is a json file next to detailsByDate.csv:
+    {file: {'sha256': ..., 'mtime_ns': ..., 'size': ..., 'date': isodate,
+            'today': isodate}}
+    where today is the other date a values page holds rows of, if any.
+    A page whose size and mtime are unchanged is skipped without reading it.
+    A page that was touched but has the same sha256 is skipped without
+    parsing it. Everything else is returned by changed() to be parsed.
+    A page byte-identical to one already recorded, under any name, is a
+    duplicate: it is recorded without a date and never parsed. Pages read
+    out of an archive are named '<archive file>!<member>' and checked by
+    the sha256 of their html with fresh(); the archive file itself is
+    recorded, without a date, once all its pages were scraped.
+    '''
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.entries = dict()
+        self.pending = dict()  # {file: (sha256, mtime_ns, size)} to record
+        self.shas = None  # sha256 of the pages recorded or pending
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as json_file:
+                self.entries = json.load(json_file)
+
+    def reset(self):
+        '''
+        Forget every page, eg: after the csv file was removed.
+        '''
+        self.entries = dict()
+        self.shas = None
+
+    def seen(self, sha):
+        '''
+        True if a page with this sha256 is recorded or pending, by any name.
+        '''
+        if self.shas is None:
+            self.shas = {e['sha256'] for e in self.entries.values()}
+            self.shas.update(p[0] for p in self.pending.values())
+        return sha in self.shas
+
+    def fresh(self, name, html):
+        '''
+        True if the page name, read from an archive, is to be parsed: its
+        html is not byte-identical to a page already recorded or pending.
+        It is then pending for record(). A duplicate is counted.
+        '''
+        sha = hashlib.sha256(html).hexdigest()
+        if self.seen(sha):
+            metrics.count('duplicate_pages')
+            return False
+        self.pending[name] = (sha, 0, len(html))
+        self.shas.add(sha)
+        return True
+
+    def changed(self, directory, files):
+        '''
+        Returns the files in directory that are new or whose content changed
+        since they were recorded.
+        '''
+        todo = []
+        for file in files:
+            st = os.stat(os.path.join(directory, file))
+            entry = self.entries.get(file)
+            if entry is not None and entry['mtime_ns'] == st.st_mtime_ns \
+                    and entry['size'] == st.st_size:
+                continue
+            sha = file_sha(os.path.join(directory, file))
+            if entry is not None and entry['sha256'] == sha:
+                entry['mtime_ns'] = st.st_mtime_ns
+                continue
+            if entry is None and self.seen(sha):
+                metrics.count('duplicate_pages')
+                self.entries[file] = {'sha256': sha,
+                                      'mtime_ns': st.st_mtime_ns,
+                                      'size': st.st_size, 'date': ''}
+                continue
+            self.pending[file] = (sha, st.st_mtime_ns, st.st_size)
+            self.seen(sha)
+            self.shas.add(sha)
+            todo.append(file)
+        return todo
+
+    def record(self, file, date, today=''):
+        '''
+        Mark file, returned by changed() or fresh(), as scraped for date
+        ('' for an archive file) and, if it also held rows of today's
+        date, for today.
+        '''
+        sha, mtime_ns, size = self.pending.pop(file)
+        self.entries[file] = {'sha256': sha, 'mtime_ns': mtime_ns,
+                              'size': size, 'date': date}
+        if today and today != date:
+            self.entries[file]['today'] = today
+
+    def save(self):
+        '''
+        Writes the manifest to a temp file and renames it over the old one.
+        '''
+        tmp = f'{self.manifest_file}.tmp'
+        with open(tmp, 'w') as json_file:
+            json_file.write(json.dumps(self.entries, indent=1) + '\n')
+        os.replace(tmp, self.manifest_file)
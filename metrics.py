@@ -0,0 +1,128 @@
+# file: metrics.py
+
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# every module logs to 'jackson'. INFO shows what the old prints showed
+# once per run (summaries, saved files); DEBUG adds the per row and per
+# cell echo of the scrape and group loops. Nothing is printed until the
+# program calls setup(): importing the modules as a library leaves
+# logging to the application.
+log = logging.getLogger('jackson')
+
+
+def setup(level='INFO'):
+    '''
+    Sets the level of the jackson logger, eg: 'DEBUG' to echo every csv row,
+    'WARNING' to only hear about failures. Messages go to stdout as plain
+    text, like the prints they replace.
+    '''
+    if not log.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def rss_mb():
+    '''
+    resident memory of this process now, in MB, from /proc on linux; the
+    peak (peak_rss_mb) elsewhere.
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb(children=False):
+    '''
+    peak resident memory of this process (or of the largest finished worker
+    process with children=True) in MB. 0 where resource is missing.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+class Metrics:
+    '''
+    Counters and timed events of a run: per page parse time, bytes read and
+    rows, wall time of the ingest/group/rank/plot stages, and counters such
+    as unknown fund names. export() writes them as json lines.
+    '''
+
+    def __init__(self):
+        self.counts = Counter()
+        self.events = []
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def event(self, kind, **fields):
+        self.events.append({'kind': kind, **fields})
+
+    @contextmanager
+    def stage(self, name, **fields):
+        '''
+        with metrics.stage('group') as st: ... records the wall time of the
+        block, and the peak rss of the process so far, as a stage event.
+        Fields set on st are added to the event.
+        '''
+        st = dict(fields)
+        t = time.perf_counter()
+        try:
+            yield st
+        finally:
+            dt = time.perf_counter() - t
+            self.event('stage', stage=name, seconds=round(dt, 6),
+                       peak_rss_mb=round(peak_rss_mb(), 1), **st)
+            log.debug(f'{name}: {dt:.3f}s')
+
+    @contextmanager
+    def scope(self):
+        '''
+        Counts made inside the block go to a fresh Counter, which is
+        yielded, instead of self.counts. Used around one page so its counts
+        can be sent back from a worker process and merged with merge().
+        '''
+        saved = self.counts
+        self.counts = Counter()
+        try:
+            yield self.counts
+        finally:
+            self.counts = saved
+
+    def merge(self, counts):
+        self.counts.update(counts)
+
+    def export(self, path):
+        '''
+        Appends the events and a final counts line to path as json lines,
+        then starts over.
+        '''
+        with open(path, 'a') as file:
+            for ev in self.events:
+                file.write(json.dumps(ev) + '\n')
+            file.write(json.dumps({'kind': 'counts', **self.counts}) + '\n')
+        self.reset()
+
+    def reset(self):
+        self.counts = Counter()
+        self.events = []
+
+
+metrics = Metrics()
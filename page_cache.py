@@ -0,0 +1,123 @@
+# file: page_cache.py
+
+import hashlib
+import json
+import os
+from metrics import metrics
+
+
+class PageCache:
+    '''
+    Disk cache of the raw values extracted from html pages (date, totals,
+    grid cell texts), before they are joined with lookupfund. An entry is
+    the json file <sha256 of the html>-<tag>.json in cache_dir, where tag
+    names the extractor, its version and the parser, so a change to any of
+    them misses instead of returning stale values. Reading a page again,
+    eg: to rebuild the csv after a lookupfund change, then costs a json
+    read instead of a BeautifulSoup parse.
+    get() touches the entry, so evict() drops the least recently used
+    entries until the cache holds at most max_bytes. Entries are written
+    atomically, so worker processes can fill the cache at the same time;
+    evict() is left to the parent process.
+    '''
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, sha, tag):
+        return os.path.join(self.cache_dir, f'{sha}-{tag}.json')
+
+    def get(self, sha, tag):
+        '''
+        the cached raw page, or None.
+        '''
+        path = self.path(sha, tag)
+        try:
+            with open(path, 'r') as file:
+                raw = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)  # recently used
+        return raw
+
+    def put(self, sha, tag, raw):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(sha, tag)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as file:
+            file.write(json.dumps(raw))
+        os.replace(tmp, path)
+
+    def entries(self):
+        '''
+        [(mtime, size, path)] of the cache entries, oldest first.
+        '''
+        if not os.path.isdir(self.cache_dir):
+            return []
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                st = entry.stat()
+                found.append((st.st_mtime, st.st_size, entry.path))
+        found.sort()
+        return found
+
+    def stats(self):
+        '''
+        {'entries', 'bytes', 'max_bytes'} of the cache.
+        '''
+        found = self.entries()
+        return {'entries': len(found), 'bytes': sum(f[1] for f in found),
+                'max_bytes': self.max_bytes}
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache holds at
+        most max_bytes. Returns the number of entries removed.
+        '''
+        found = self.entries()
+        total = sum(f[1] for f in found)
+        removed = 0
+        for mtime, size, path in found:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def invalidate(self, tag=None):
+        '''
+        Remove every entry, or only the entries whose tag starts with tag.
+        Returns the number of entries removed.
+        '''
+        removed = 0
+        for mtime, size, path in self.entries():
+            name = os.path.basename(path)[:-len('.json')]
+            if tag is None or name.split('-', 1)[1].startswith(tag):
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+def extract(cache, tag, html, extract_page):
+    '''
+    extract_page(html) through the cache: the raw page cached for the
+    sha256 of html and tag, else extract_page(html), which is then cached.
+    cache None means no caching.
+    '''
+    if cache is None:
+        return extract_page(html)
+    sha = hashlib.sha256(html).hexdigest()
+    raw = cache.get(sha, tag)
+    if raw is not None:
+        metrics.count('cache_hit')
+        return raw
+    metrics.count('cache_miss')
+    raw = extract_page(html)
+    cache.put(sha, tag, raw)
+    return raw
@@ -0,0 +1,612 @@
+# file: pipeline.py
+
+import os
+import logging
+from bisect import bisect_left
+import archive
+import ingest
+import layouts
+import page_cache
+import registry
+import rollup
+import running
+from batch_writer import CsvBatchWriter
+from group_cache import GroupCache, slice_groups
+from sqlstore import SqlStore
+from metrics import log, metrics
+from records import day, dump_groups, isodate, pct
+# bs4, urllib.request, numpy (analytics, colstore) and matplotlib are
+# imported in the methods that use them, so eg: ranking from a cron job
+# never pays for matplotlib and grouping never loads bs4 (numpy only to
+# read the column store).
+
+
+class Pipeline:
+    '''
+    What RecoverJackson and ScrapeSavePlot share: reading pages, storing
+    their rows (csv or sqlite), grouping, ranking and plotting. A subclass
+    names its spt module (paths and settings), pages_attr, the attribute
+    of the directory its pages are saved in, and layout, the page layout
+    it reads (see layouts.py). Each page is read with the layout detected
+    from its first bytes, so either reader can read either kind of page;
+    layout is used when no marker is found, or always when sniff is
+    False.
+    '''
+    spt = None
+    pages_attr = None
+    layout = None
+
+    def __init__(self, parser=None, backend=None, account=None,
+                 workdir=None, sniff=None):
+        '''
+        set paths and files on self from the spt file.
+        parser selects the html backend (see spt.parsers); default spt.parser.
+        backend 'csv' or 'sqlite' selects where rows are stored; default
+        spt.backend.
+        account names the account of spt.registry (funds.json) whose funds
+        are looked up and whose pages and files are used; default
+        spt.account. Other accounts than the registry's default keep them
+        in <pages dir>/<account>/ (see Registry.path), so rows are stored
+        per account. account may also be a registry.Account itself.
+        workdir, if given, is the pages dir and holds every file the
+        reader writes, under the names spt gives them, eg: for bench.py.
+        sniff False always reads pages with layout; default
+        spt.sniff_layout.
+        '''
+        spt = self.spt
+        reg = spt.registry
+        self.account = account if isinstance(account, registry.Account) \
+            else reg.account(account or spt.account)
+        name = self.account.name
+
+        def place(path):
+            if workdir:
+                return os.path.join(workdir, os.path.basename(path))
+            return reg.path(path, name)
+        setattr(self, self.pages_attr,
+                workdir or reg.directory(getattr(spt, self.pages_attr), name))
+        self.csv_file = place(spt.csv_file)
+        self.store_file = place(spt.store_file)
+        self.charts_dir = place(spt.charts_dir)
+        self.rank_file = place(spt.rank_file)
+        self.corr_file = place(spt.corr_file)
+        self.corr_cache = None  # analytics.ResultCache of corr_file
+        # the page cache is keyed by content, so accounts share it
+        cache_dir = spt.page_cache_dir and workdir and \
+            place(spt.page_cache_dir) or spt.page_cache_dir
+        self.page_cache = page_cache.PageCache(cache_dir,
+                                               spt.page_cache_bytes) \
+            if cache_dir else None
+        self.ingest_batch = spt.ingest_batch
+        self.memory_mb = spt.memory_mb
+        self.today_rows = getattr(spt, 'today_rows', True)
+        self.sniff = spt.sniff_layout if sniff is None else sniff
+        self.group_cache = GroupCache(self.csv_file,
+                                      place(spt.by_fund_file),
+                                      place(spt.group_state_file),
+                                      spt.GroupByFund)
+        self.group_cache.snapshot = self.stored_groups
+        self.stats_cache = running.StatsCache(self.csv_file,
+                                              place(spt.stats_file))
+        self.rollup_cache = rollup.RollupCache(self.csv_file,
+                                               place(spt.rollup_file))
+        self.lookupfund = self.account.lookupfund()
+        self.groupbyfund = dict()  # {fundId: GroupByFund(...)}
+        self.parser = parser or spt.parser
+        if self.parser not in spt.parsers:
+            raise ValueError(f'parser must be one of {spt.parsers}')
+        self.backend = backend or spt.backend
+        if self.backend not in spt.backends:
+            raise ValueError(f'backend must be one of {spt.backends}')
+        self.db_file = place(spt.db_file)
+        # the sqlite backend keeps its own record of the pages it holds,
+        # and its own groupByfund.json: the csv's is trusted by group_cache
+        # as long as the csv did not change
+        if self.backend == 'sqlite':
+            self.manifest_file = place(spt.db_manifest_file)
+            self.by_fund_file = place(spt.db_by_fund_file)
+        else:
+            self.manifest_file = place(spt.manifest_file)
+            self.by_fund_file = place(spt.by_fund_file)
+        os.makedirs(os.path.dirname(self.csv_file), exist_ok=True)
+
+    @property
+    def pages_dir(self):
+        return getattr(self, self.pages_attr)
+
+    def isodate(self, date):
+        '''
+        jackson formats dates as mm/dd/yyyy eg: 08/18/2022
+        iso formats dates as yyyy-mm-dd eg: 2022-08-18
+        All dates in this class will be formatted for iso.
+        This function will convert jackson to iso format.
+        If date is already iso formatted, it is returned.
+        '''
+        return layouts.mdy_iso(date)
+
+    def save_to_csv(self, jfs):
+        '''
+        jfs is a list of JacksonFund, eg: one page. They are appended to
+        csv_file with one atomic, journaled write (see CsvBatchWriter).
+        '''
+        writer = CsvBatchWriter(self.csv_file)
+        writer.extend(jfs)
+        writer.append()
+
+    def read_page(self, file):
+        '''
+        file is an html file in the pages dir to be scraped.
+        Use beautiful soup to scrape info from page and return its list of
+        JacksonFund, the JacksonFunds total first, then the subaccounts.
+        Nothing is written, so pages can be read in worker processes.
+        All dates will be expressed as isodates eg: '2022-08-19'
+        '''
+        from urllib.request import urlopen
+        url = f'file://{self.pages_dir}/{file}'
+        with urlopen(url) as page:
+            html = page.read()
+        return self.read_html(html)
+
+    def read_html(self, html):
+        '''
+        The JacksonFund records of a page given as html bytes, eg: a page
+        streamed out of an archive (see archive.py), as read_page returns.
+        The layout is sniffed from the first bytes of the page (see
+        layouts.detect). The texts extracted from a page are kept in
+        page_cache, keyed by the sha256 of the html, so reading the page
+        again only joins them with the account.
+        '''
+        metrics.count('bytes_read', len(html))
+        layout = layouts.detect(html, self.layout) if self.sniff \
+            else self.layout
+        raw = page_cache.extract(
+            self.page_cache, self.cache_tag(layout), html,
+            lambda html: layout.extract_html(html, self.parser))
+        return layout.join(raw, self.account, self.today_rows)
+
+    def cache_tag(self, layout=None):
+        '''
+        names the extractor of the cached pages: layout, version, parser.
+        '''
+        return (layout or self.layout).cache_tag(self.parser)
+
+    def open_and_read(self, file):
+        '''
+        Scrape file and append its JacksonFund records to csv_file, or
+        upsert them into db_file with the sqlite backend.
+        '''
+        if self.backend == 'sqlite':
+            with self.sql_store() as store:
+                store.upsert(self.read_page(file))
+        else:
+            self.save_to_csv(self.read_page(file))
+
+    def html_files(self):
+        '''
+        the sorted html files, and archives of them, in the pages dir.
+        '''
+        return sorted(f for f in os.listdir(self.pages_dir)
+                      if archive.is_source(f))
+
+    def scrape_files(self, directory, files, workers=None, rebuild=False):
+        '''
+        Scrape the html files in directory, which becomes the pages dir,
+        into csv_file (db_file with the sqlite backend). Pages are parsed
+        by a pool of worker processes (default spt.workers, 1 parses in
+        this process) and written in order of the date parsed from each
+        page, so the csv is the same whatever the worker count. A page
+        that fails is reported and skipped; the failures are returned as
+        {file: error}. Pages already listed, unchanged, in manifest_file
+        are not parsed again, and rows of a re-saved page replace the old
+        rows for the same (fundId, date). rebuild=True scrapes every page
+        into a new csv file, eg: after a change to funds.json; the pages
+        are then read from the page cache, not parsed again. files may
+        also be .html.gz, .zip or tar files of pages, read without
+        extracting them. Used by the command line, see jackson.py.
+        '''
+        setattr(self, self.pages_attr, directory)
+        return ingest.scrape(self, directory, files,
+                             workers or self.spt.workers,
+                             self.manifest_file, rebuild)
+
+    def group_by_fund(self, start=None, end=None):
+        '''
+        Builds self.groupbyfund {fundId: GroupByFund} from the stored rows,
+        see group_csv(). With the sqlite backend it is read from db_file by
+        an indexed query. start and end (isodates, inclusive) keep only
+        the dates in that range; groupByfund.json is saved for the full
+        range only. The wall time is recorded as the 'group' stage.
+        '''
+        with metrics.stage('group', backend=self.backend) as st:
+            if self.backend == 'sqlite':
+                with self.sql_store() as store:
+                    self.groupbyfund = store.group_by_fund(
+                        self.spt.GroupByFund, start, end)
+                if start is None and end is None:
+                    self.save_group_by_fund()
+            else:
+                self.group_csv()
+                if start is not None or end is not None:
+                    self.groupbyfund = slice_groups(self.groupbyfund,
+                                                    start, end)
+            st['funds'] = len(self.groupbyfund)
+
+    def find_gaps(self, start=None, end=None):
+        '''
+        {fundId: [isodate, ...]} of the trading days (monday to friday)
+        between start and end that a fund has no row for, eg: pages that
+        were never saved. See GroupByFund.gaps.
+        '''
+        self.group_by_fund()
+        gaps = {k: v.gaps(start, end) for k, v in self.groupbyfund.items()}
+        return {k: v for k, v in gaps.items() if v}
+
+    def sql_store(self):
+        '''
+        Returns a new SqlStore of db_file, see sqlstore.py, which the
+        caller closes, eg:
+        with rj.sql_store() as store:
+            store.rows('2022-09-05', '2022-09-20', 222)
+        '''
+        return SqlStore(self.db_file, self.spt.JacksonFund)
+
+    def group_csv(self, save=True):
+        '''
+        Reads the entries appended to csv file: detailsByDate.csv since
+        the last call (see GroupCache; a rewritten csv is read in full),
+        and merges them by date into self.groupbyfund, so the csv rows need
+        not be in date order. groupByfund.json is only
+        rewritten when there were new entries, or entries grouped with
+        save=False (see stored_values), which only keeps them in memory. It
+        collects all fundid, allocation, dates and amounts into a
+        GroupByFund (see records.py), which has fundId, invested,
+        allocated, percent and the arrays days, values, nvalues.
+        The arrays are associated so days[0] corresponds to: values[0]
+        csv: 66,JNL/BlackRock®GlobalNaturalResources,9000,15.00%,14.40%,738.3417,11.544138,8523.52,2022-09-02  # noqa: E501
+        '''
+        self.groupbyfund, rows = self.group_cache.load()
+        if not rows:
+            if save and self.group_cache.unsaved:
+                self.save_group_by_fund()
+                self.group_cache.save()
+            return  # csv unchanged since the last run
+        GroupByFund = self.spt.GroupByFund
+        # echo every row only at DEBUG level, checked once for the loop
+        echo = log.isEnabledFor(logging.DEBUG)
+        n = 0
+        late = dict()  # {fundId: [(day, value, nvalue)]} dated out of order
+        for n, row in enumerate(rows, 1):
+            if echo:
+                log.debug(row)
+            fid = int(row[0])
+            iv = float(row[2])
+            val = float(row[7])
+            d = day(self.isodate(row[9]))
+            gbf = self.groupbyfund.get(fid)
+            if gbf is None:
+                gbf = GroupByFund(fid, iv, row[3], row[4])
+                self.groupbyfund[fid] = gbf
+            elif d < gbf.days[0]:
+                # allocated and percent are those of the fund's earliest row
+                gbf.allocated, gbf.percent = pct(row[3]), pct(row[4])
+            if not gbf.days or d > gbf.days[-1]:
+                gbf.append(d, val, round(val / iv, 3))
+            else:
+                late.setdefault(fid, []).append((d, val, round(val / iv, 3)))
+        # rows of pages scraped out of order are merged by date, once a fund
+        for fid, fund_rows in late.items():
+            self.groupbyfund[fid].merge(fund_rows)
+        metrics.count('rows_grouped', n)
+        metrics.count('late_rows', sum(map(len, late.values())))
+
+        # after the new csv rows, save the updated dictionary
+        if save:
+            self.save_group_by_fund()
+            self.group_cache.save()
+        else:
+            self.group_cache.keep()
+
+    def stored_values(self, dates):
+        '''
+        {(fundId, isodate): value} of the rows of csv_file dated on one of
+        dates (isodates), that an ingest compares its rows with (see
+        ingest.commit). They are looked up in the groups of group_csv,
+        caught up in memory only, so after the first call, which reads
+        groupByfund.json (or the csv, when it has no state), a call costs
+        the rows appended since plus a bisection a fund and date.
+        '''
+        if not os.path.exists(self.csv_file):
+            return dict()
+        self.group_csv(save=False)
+        days = sorted(day(d) for d in dates)
+        found = dict()
+        for fid, g in self.groupbyfund.items():
+            for d in days:
+                i = bisect_left(g.days, d)
+                if i < len(g.days) and g.days[i] == d:
+                    found[(fid, isodate(d))] = g.values[i]
+        return found
+
+    def update_stats(self):
+        '''
+        Brings the running statistics of every fund (see running.py) up to
+        the stored rows and returns them, {fundId: RunningStats}, see
+        catch_up(). csv backend only; ingest calls it after every scrape
+        that added rows.
+        '''
+        return self.catch_up('stats', self.stats_cache, running.push_rows,
+                             running.RunningStats.of)
+
+    def update_rollups(self):
+        '''
+        Brings the rollup pyramid of every fund (weekly, monthly,
+        quarterly, yearly and since inception bars, see rollup.py) up to
+        the stored rows and returns it, {fundId: FundRollup}, see
+        catch_up(). csv backend only; ingest calls it after every scrape
+        that added rows.
+        '''
+        return self.catch_up('rollup', self.rollup_cache, rollup.push_rows,
+                             rollup.FundRollup.of)
+
+    def catch_up(self, name, cache, push_rows, build):
+        '''
+        Feeds the csv rows appended since cache (a GroupCache of per fund
+        aggregates) was saved to push_rows, in O(1) a row, and saves it.
+        The funds push_rows returns, which got a row dated on or before
+        their last one (a page scraped out of order, a re-saved page), are
+        built again from their history with build(GroupByFund). Returns
+        the {fundId: aggregate}. The wall time is the name stage.
+        '''
+        with metrics.stage(name) as st:
+            aggregate, rows = cache.load()
+            if not rows:
+                return aggregate
+            late = push_rows(aggregate, rows)
+            if late:
+                self.group_by_fund()
+                for fid in late:
+                    aggregate[fid] = build(self.groupbyfund[fid])
+            st['late_funds'] = len(late)
+            cache.save()
+            return aggregate
+
+    def rollups(self):
+        '''
+        {fundId: FundRollup} of the stored rows: kept up to date by
+        update_rollups() with the csv backend, built from group_by_fund()
+        with sqlite.
+        '''
+        if self.backend == 'csv':
+            return self.update_rollups()
+        self.group_by_fund()
+        return {k: rollup.FundRollup.of(g)
+                for k, g in self.groupbyfund.items()}
+
+    def summary(self, period='year'):
+        '''
+        {fundId: bar} of the latest bucket of period of every fund, see
+        rollup.Bars.bar: 'year' is the year to date, 'all' the history
+        since inception, 'quarter', 'month' and 'week' the current ones.
+        A bar has the open, close, min, max and mean of the nvalues and
+        values; reading it costs the same however long the history is.
+        '''
+        return {k: r.bars[period].bar() for k, r in self.rollups().items()
+                if len(r.bars[period])}
+
+    def plot_groups(self, start=None, end=None, points=None):
+        '''
+        (resolution, {fundId: GroupByFund}) to chart the dates from start
+        to end (isodates, None is unbounded) with at most about points
+        (default spt.plot_points) dates a fund: the daily rows of
+        group_by_fund() when the range has few enough dates, else the
+        closes of the weekly, monthly or quarterly rollups, the finest
+        that fits (see rollup.pick), which never loads the daily history.
+        '''
+        rollups = self.rollups()
+        if rollups:
+            lo = day(start) if start is not None else \
+                min(r.bars['week'].starts[0] for r in rollups.values())
+            hi = day(end) if end is not None else \
+                max(r.last_day for r in rollups.values())
+            res = rollup.pick(lo, hi, points or self.spt.plot_points)
+            if res != 'day':
+                groups = {k: r.group(res, lo, hi)
+                          for k, r in rollups.items()}
+                return res, {k: g for k, g in groups.items() if len(g)}
+        self.group_by_fund(start, end)
+        return 'day', self.groupbyfund
+
+    def save_group_by_fund(self):
+        '''
+        Writes the contents of self.group_by_fund to disk as json file.
+        '''
+        with open(self.by_fund_file, 'w') as json_file:
+            dump_groups(self.groupbyfund, json_file)
+        log.info("groupbyfund dictionary is saved to disk...")
+
+    def save_store(self):
+        '''
+        Builds the memory mapped column store, store_file, from csv_file.
+        See colstore.py; the store can export csv and json again. It
+        records the version of the csv it holds, so group_by_fund starts
+        from it and reads only the rows appended since.
+        '''
+        import colstore
+        colstore.write_store(self.csv_file, self.store_file, self.isodate,
+                             self.group_cache.version())
+
+    def store_stale(self):
+        '''
+        True when the column store is missing, no longer holds the start of
+        the csv (it was rewritten), or the csv grew by more than
+        1/colstore.SLACK past it, so the rows group_by_fund reads after it
+        stay a small part of the history.
+        '''
+        if not os.path.exists(self.store_file):
+            return True
+        import colstore
+        version = self.load_store().version
+        st = os.stat(self.csv_file)
+        if version is None or not self.group_cache.covers(version, st):
+            return True
+        return st.st_size - version[1] > version[1] // colstore.SLACK
+
+    def stored_groups(self):
+        '''
+        (version, {fundId: GroupByFund}) of the column store if it holds
+        the start of the csv as it is now, else None; see
+        GroupCache.snapshot. Its arrays are copied out of the memory map,
+        which is much faster than reading groupByfund.json.
+        '''
+        if not os.path.exists(self.store_file):
+            return None
+        store = self.load_store()
+        version = store.version
+        if version is None or not self.group_cache.covers(
+                version, os.stat(self.csv_file)):
+            return None
+        return version, store.group_by_fund(self.spt.GroupByFund)
+
+    def load_store(self):
+        '''
+        Returns the ColumnStore of store_file. store.fund(fundId) gives the
+        fund's days, values, nvalues, num_units and unit_values as numpy
+        arrays mapped from the file without copying.
+        '''
+        import colstore
+        return colstore.ColumnStore(self.store_file)
+
+    def rank_funds(self, window=None, start=None, end=None, out=None):
+        '''
+        Ranks the accounts by their average normalized value, best first,
+        and prints avg - stdev for each, as before. All metrics come from
+        one vectorized pass over the fund x date matrix (see analytics.py)
+        and are returned as a structured array, one row per account: mean,
+        stdev, daily returns, cumulative return, max drawdown, sharpe-like
+        ratio and the same over the last window dates (default
+        spt.rank_window). start and end limit the dates, see group_by_fund.
+        out is a json file to write the table to instead of printing it,
+        see analytics.save_table.
+        Over the whole history of the csv backend the table comes from the
+        running statistics kept by update_stats(), in O(funds) however many
+        dates are stored; a start or end date, a window of running.TAIL
+        dates or more, or the sqlite backend use the histories, see
+        group_by_fund.
+        '''
+        window = window or self.spt.rank_window
+        import analytics
+        if self.backend == 'csv' and start is None and end is None \
+                and window < running.TAIL:
+            stats = self.update_stats()
+            with metrics.stage('rank', funds=len(stats), running=True):
+                table = analytics.rank_running(stats, window)
+        else:
+            self.group_by_fund(start, end)
+            with metrics.stage('rank', funds=len(self.groupbyfund)):
+                table = analytics.rank_table(self.groupbyfund, window)
+        if out:
+            analytics.save_table(table, out)
+            return table
+        print(' Jackson Subaccounts Ranked by average ROI Performance:')
+        for t in table:
+            print(f' jf{t["fundId"]} : {round(t["mean"], 3)} - '
+                  f'{round(t["stdev"], 3)}')
+        return table
+
+    def data_version(self):
+        '''
+        What the stored rows are now, to key results computed from them:
+        the csv inode, length and last bytes (GroupCache.version), or the
+        database's modification time and size with sqlite. Reading it
+        costs a stat and a seek, not a scan of the rows.
+        '''
+        if self.backend == 'sqlite':
+            st = os.stat(self.db_file)
+            return [st.st_mtime_ns, st.st_size]
+        return self.group_cache.version()
+
+    def correlate(self, window=None, start=None, end=None, out=None):
+        '''
+        How the funds move together: the covariance and correlation of the
+        daily returns of every pair of funds over the dates from start to
+        end, and over the window dates (default spt.corr_window) ending at
+        each date, see analytics.correlate. Returns its dict of arrays.
+        The result is kept in corr_file keyed by data_version() and the
+        arguments, so it is only computed again after rows are ingested
+        (the 'correlate' stage reports cached). out is a json file to
+        write it to instead of printing the correlations, see
+        analytics.save_correlation.
+        '''
+        window = window or self.spt.corr_window
+        import analytics
+        if self.corr_cache is None:
+            self.corr_cache = analytics.ResultCache(self.corr_file)
+        key = f'{self.data_version()}|{window}|{start}|{end}'
+        with metrics.stage('correlate') as st:
+            result = self.corr_cache.get(key)
+            st['cached'] = result is not None
+            if result is None:
+                self.group_by_fund(start, end)
+                result = analytics.correlate(self.groupbyfund, window)
+                self.corr_cache.put(key, result)
+            st['funds'] = len(result['fund_ids'])
+        if out:
+            analytics.save_correlation(result, out)
+            return result
+        ids = result['fund_ids'].tolist()
+        print(' Correlation of the daily returns:')
+        print(' ' * 8 + ''.join(f'{f"jf{f}":>8}' for f in ids))
+        for fid, row in zip(ids, result['corr']):
+            print(f'{f"jf{fid}":>8}' + ''.join(f'{c:8.2f}' for c in row))
+        return result
+
+    def plot_normalized(self, start=None, end=None, out=None):
+        '''
+        Uses matplotlib.plt and dict, self.groupbyfund,
+        to plot normalized account value over time.
+        a GroupByFund from dict, self.groupbyfund, holds dates and normalized
+        values as lists which will yield X[] and Y[] needed for plt.
+        If out is a file name the figure is saved there instead of shown,
+        see render_charts() for the charts of every fund. Long ranges are
+        drawn from the weekly, monthly or quarterly closes, see
+        plot_groups().
+        '''
+        # load the daily rows or the rollups of the csv file or database.
+        res, groups = self.plot_groups(start, end)
+        with metrics.stage('plot', funds=len(groups), resolution=res):
+            self.draw_normalized(out, groups)
+
+    def draw_normalized(self, out=None, groupbyfund=None):
+        '''
+        Draws groupbyfund (default self.groupbyfund) on a real date axis,
+        see render.py; long series are downsampled to the width of the
+        plot. With out the figure is rendered by Agg into that file,
+        otherwise it is shown.
+        '''
+        import render
+        if groupbyfund is None:
+            groupbyfund = self.groupbyfund
+        if out is not None:
+            fig = render.new_figure()
+            render.draw_portfolio(fig.subplots(), groupbyfund)
+            fig.savefig(out)
+            return
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(constrained_layout=True)
+        render.draw_portfolio(ax, groupbyfund)
+        plt.show()
+
+    def render_charts(self, out_dir=None, fmt='png', start=None, end=None):
+        '''
+        Headless batch rendering with Agg: writes portfolio.<fmt> and one
+        fund<fundId>.<fmt> per fund into out_dir (default charts_dir).
+        fmt is 'png' or 'svg'. Returns the paths of the files written.
+        Long ranges are drawn from the rollups, see plot_groups().
+        '''
+        res, groups = self.plot_groups(start, end)
+        import render
+        names = self.account.names()
+        with metrics.stage('render', funds=len(groups), fmt=fmt,
+                           resolution=res):
+            return render.render_all(groups, out_dir or self.charts_dir,
+                                     fmt, names)
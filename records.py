@@ -0,0 +1,312 @@
+# file: records.py
+
+import datetime
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+
+# day ordinal of 1970-01-01, where numpy's datetime64 days count from
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def pct(text):
+    '''
+    '14.52%' -> 14.52, '' -> nan, numbers are returned as floats.
+    '''
+    if not isinstance(text, str):
+        return float(text)
+    text = text.strip().rstrip('%')
+    return float(text) if text else float('nan')
+
+
+def num(x):
+    '''
+    format a stored float for csv: 9000.0 -> '9000', 8.5 -> '8.5'
+    '''
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+
+def pct_text(x):
+    '''
+    14.52 -> '14.52%', 15.0 -> '15%', nan -> ''
+    '''
+    return '' if x != x else f'{num(x)}%'
+
+
+def given_text(x):
+    '''
+    the text a value was given as, the way the csv has always stored it:
+    text with its spaces removed, numbers as str() gives them, eg:
+    ' 15.00% ' -> '15.00%', 60000.0 -> '60000.0', 9000 -> '9000'
+    '''
+    return x.replace(' ', '') if isinstance(x, str) else str(x)
+
+
+def day(date):
+    '''
+    day ordinal of an isodate '2022-09-01', a jackson date '09/01/2022' or
+    an ordinal.
+    '''
+    if not isinstance(date, str):
+        return int(date)
+    if '/' in date:
+        m, d, y = date.split('/')
+        return datetime.date(int(y), int(m), int(d)).toordinal()
+    return datetime.date.fromisoformat(date).toordinal()
+
+
+def isodate(d):
+    '''
+    day ordinal -> '2022-09-01'
+    '''
+    return datetime.date.fromordinal(int(d)).isoformat()
+
+
+def trading_day(d):
+    '''
+    True for monday to friday. Day ordinal 1 (0001-01-01) is a monday.
+    '''
+    return (d - 1) % 7 < 5
+
+
+def days(dates):
+    '''
+    array('i') of the day ordinals of a sequence of dates (see day()).
+    '''
+    if isinstance(dates, array) and dates.typecode == 'i':
+        return array('i', dates)
+    return array('i', [day(d) for d in dates])
+
+
+class JacksonFund:
+    '''
+    One scraped row: a subaccount (or the JacksonFunds total, -999) on one
+    date. Fields are typed: percentages are floats (15.0 for '15%') and the
+    date is kept as a day ordinal, day; date gives the isodate. The
+    constructor takes the old string forms too, so
+    JacksonFund(66, 'JNL/...', 9000, '15%', '15.00%', '14.40%', 738.3417,
+                11.544138, 8523.52, 0.947, '2022-09-02')
+    works as the namedtuple did. row() is the serialised form. The fields
+    of TEXTS are written as they were given (see given_text), eg: '15.00%'
+    of a details page or 60000.0 of its total, so new rows match the
+    history already stored; texts only holds those that differ from the
+    shortest form, so most rows carry none.
+    '''
+    __slots__ = ('fundId', 'name', 'invested', 'allocated', 'future_pct',
+                 'actual_pct', 'num_units', 'unit_value', 'value', 'nvalue',
+                 'day', 'texts')
+    _fields = ('fundId', 'name', 'invested', 'allocated', 'future_pct',
+               'actual_pct', 'num_units', 'unit_value', 'value', 'nvalue',
+               'date')
+    TEXTS = {'invested': num, 'allocated': pct_text, 'future_pct': pct_text,
+             'actual_pct': pct_text, 'num_units': num}
+
+    def __init__(self, fundId, name, invested, allocated, future_pct,
+                 actual_pct, num_units, unit_value, value, nvalue, date):
+        self.fundId = int(fundId)
+        self.name = name
+        self.invested = float(invested)
+        self.allocated = pct(allocated)
+        self.future_pct = pct(future_pct)
+        self.actual_pct = pct(actual_pct)
+        self.num_units = float(num_units)
+        self.unit_value = float(unit_value)
+        self.value = float(value)
+        self.nvalue = float(nvalue)
+        self.day = day(date)
+        self.texts = None
+        given = {'invested': invested, 'allocated': allocated,
+                 'future_pct': future_pct, 'actual_pct': actual_pct,
+                 'num_units': num_units}
+        for f, form in self.TEXTS.items():
+            text = given_text(given[f])
+            if text != form(getattr(self, f)):
+                if self.texts is None:
+                    self.texts = dict()
+                self.texts[f] = text
+
+    def text(self, field):
+        '''
+        the csv text of a field of TEXTS, as it was given.
+        '''
+        if self.texts and field in self.texts:
+            return self.texts[field]
+        return self.TEXTS[field](getattr(self, field))
+
+    @property
+    def date(self):
+        return isodate(self.day)
+
+    def row(self):
+        '''
+        the fields in _fields order, percentages and date as text, as they
+        are stored in the database.
+        '''
+        return (self.fundId, self.name, self.invested,
+                self.text('allocated'), self.text('future_pct'),
+                self.text('actual_pct'), self.num_units, self.unit_value,
+                self.value, self.nvalue, self.date)
+
+    def __eq__(self, other):
+        return isinstance(other, JacksonFund) and self.row() == other.row()
+
+    def __repr__(self):
+        fields = ', '.join(f'{f}={v!r}' for f, v in zip(self._fields,
+                                                         self.row()))
+        return f'JacksonFund({fields})'
+
+
+class GroupByFund:
+    '''
+    The history of one fund: fundId, invested, allocated and percent
+    (floats, from the fund's first row) and its days, values and nvalues
+    in date order, a sorted index keyed by the day ordinal. These are
+    typed arrays (array('i') of day ordinals,
+    array('d') of floats), which grow in place with amortised O(1)
+    append(), store a row in 20 bytes instead of three boxed python
+    objects, and convert to numpy without copying: np.asarray(g.values).
+    dates is the list of isodates. GroupByFund(fundId, invested,
+    allocated, percent, dates, values, nvalues) takes the lists of the
+    groupByfund.json format, and to_list() gives them back.
+    '''
+    __slots__ = ('fundId', 'invested', 'allocated', 'percent', 'days',
+                 'values', 'nvalues')
+
+    def __init__(self, fundId, invested, allocated, percent, dates=(),
+                 values=(), nvalues=()):
+        self.fundId = int(fundId)
+        self.invested = float(invested)
+        self.allocated = pct(allocated)
+        self.percent = pct(percent)
+        self.days = days(dates)
+        self.values = array('d', values)
+        self.nvalues = array('d', nvalues)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def dates(self):
+        return [isodate(d) for d in self.days]
+
+    def append(self, d, value, nvalue):
+        '''
+        add the row of day ordinal d (or an isodate).
+        '''
+        self.days.append(day(d))
+        self.values.append(value)
+        self.nvalues.append(nvalue)
+
+    def insert(self, d, value, nvalue):
+        '''
+        add the row of day ordinal d in date order, or replace the row of
+        that day. The common case, a later day, is an amortised O(1)
+        append. An earlier day is placed by bisection, but inserting it
+        shifts the rows after it, so each one costs O(n): for the late
+        rows of a backfill use merge(), which places them all in one pass.
+        '''
+        d = day(d)
+        if not self.days or d > self.days[-1]:
+            self.append(d, value, nvalue)
+            return
+        i = bisect_left(self.days, d)
+        if self.days[i] == d:
+            self.values[i] = value
+            self.nvalues[i] = nvalue
+        else:
+            self.days.insert(i, d)
+            self.values.insert(i, value)
+            self.nvalues.insert(i, nvalue)
+
+    def merge(self, rows):
+        '''
+        add rows [(day ordinal, value, nvalue)], in any order, in date
+        order; a row replaces the row of its day, and of two rows of one
+        day the later in rows wins, as with insert(). The arrays are
+        rebuilt once, so merging k rows into n costs O(n + k log k)
+        instead of the O(k n) of k inserts.
+        '''
+        if not rows:
+            return
+        late = dict()
+        for d, value, nvalue in rows:
+            late[d] = (value, nvalue)
+        old_days, old_values, old_nvalues = self.days, self.values, \
+            self.nvalues
+        self.days, self.values, self.nvalues = \
+            array('i'), array('d'), array('d')
+        i = 0
+        for d, (value, nvalue) in sorted(late.items()):
+            j = bisect_left(old_days, d, i)
+            self.days.extend(old_days[i:j])
+            self.values.extend(old_values[i:j])
+            self.nvalues.extend(old_nvalues[i:j])
+            self.append(d, value, nvalue)
+            i = j + 1 if j < len(old_days) and old_days[j] == d else j
+        self.days.extend(old_days[i:])
+        self.values.extend(old_values[i:])
+        self.nvalues.extend(old_nvalues[i:])
+
+    def index(self, start=None, end=None):
+        '''
+        (i, j) such that days[i:j] are the days between start and end
+        (isodates or ordinals, inclusive, None is unbounded), by bisection.
+        '''
+        i = bisect_left(self.days, day(start)) if start is not None else 0
+        j = bisect_right(self.days, day(end)) if end is not None \
+            else len(self.days)
+        return i, max(i, j)
+
+    def gaps(self, start=None, end=None):
+        '''
+        isodates of the trading days (monday to friday) between start and
+        end that have no row, eg: a page that was never saved. Market
+        holidays are not known here, so they are listed too.
+        '''
+        i, j = self.index(start, end)
+        missing = []
+        for a, b in zip(self.days[i:j], self.days[i + 1:j]):
+            missing.extend(isodate(d) for d in range(a + 1, b)
+                           if trading_day(d))
+        return missing
+
+    def slice(self, i, j):
+        '''
+        a new GroupByFund of rows i to j.
+        '''
+        return GroupByFund(self.fundId, self.invested, self.allocated,
+                           self.percent, self.days[i:j], self.values[i:j],
+                           self.nvalues[i:j])
+
+    def to_list(self):
+        '''
+        [fundId, invested, allocated, percent, dates, values, nvalues] with
+        text percentages and isodates, the groupByfund.json format.
+        '''
+        return [self.fundId, self.invested, pct_text(self.allocated),
+                pct_text(self.percent), self.dates, self.values.tolist(),
+                self.nvalues.tolist()]
+
+    def __repr__(self):
+        return (f'GroupByFund(fundId={self.fundId}, invested={self.invested}'
+                f', allocated={self.allocated}, percent={self.percent}'
+                f', n={len(self)})')
+
+
+def dumps_groups(groupbyfund):
+    '''
+    {fundId: GroupByFund} as the json text of groupByfund.json.
+    '''
+    return json.dumps({k: v.to_list() for k, v in groupbyfund.items()})
+
+
+def dump_groups(groupbyfund, file):
+    '''
+    Writes dumps_groups(groupbyfund) and a newline to file one fund at a
+    time, so only one fund's lists are built in memory at once.
+    '''
+    file.write('{')
+    for i, (k, v) in enumerate(groupbyfund.items()):
+        file.write(f'{", " if i else ""}{json.dumps(str(k))}: '
+                   f'{json.dumps(v.to_list())}')
+    file.write('}\n')
@@ -1,43 +1,38 @@
 # recover_spt.py
 
 import os
-from collections import namedtuple
+from common_spt import *  # noqa: F401,F403
 
 data_dir = f'{os.getcwd()}/data'
 recover_dir = f'{os.getcwd()}/recover'
 csv_file = f'{recover_dir}/detailsByDate.csv'
 by_fund_file = f'{recover_dir}/groupByfund.json'
-
-FundInfo = namedtuple('FundInfo', ['fundId', 'invested', 'allocated'])
-
-
-# used to get fundId, invested, allocated, given the fund name
-lookupfund = dict()
-lookupfund.update(
-    {'JNL/MellonEnergySector': FundInfo(190, 9000, '15%')})
-lookupfund.update(
-    {'JNL/BlackRock®GlobalNaturalResources': FundInfo(66, 9000, '15%')})
-lookupfund.update(
-    {'JNL/MellonUtilitiesSector': FundInfo(635, 6000, '10%')})
-lookupfund.update(
-    {'JNL/NewtonEquityIncome': FundInfo(606, 6000, '10%')})
-lookupfund.update(
-    {'JNL/InvescoDiversifiedDividend': FundInfo(365, 9000, '15%')})
-lookupfund.update(
-    {'JNL/MellonConsumerStaplesSector': FundInfo(368, 6000, '10%')})
-lookupfund.update(
-    {'JNL/DFAU.S.CoreEquity': FundInfo(115, 6000, '10%')})
-lookupfund.update(
-    {'JNL/MellonNasdaq®100Index': FundInfo(222, 9000, '15%')})
-lookupfund.update(
-    {'JacksonFunds': FundInfo(-999, 60000, '100%')})
-
-
-JacksonFund = namedtuple('JacksonFund',
-                         ['fundId', 'name', 'invested', 'allocated',
-                          'future_pct', 'actual_pct', 'num_units',
-                          'unit_value', 'value', 'nvalue', 'date'])
-
-GroupByFund = namedtuple('GroupByFund', ['fundId', 'invested', 'allocated',
-                                         'percent', 'dates', 'values',
-                                         'nvalues'])
+charts_dir = f'{recover_dir}/charts'
+manifest_file = f'{recover_dir}/ingested.json'
+store_file = f'{recover_dir}/groupByfund.jfc'
+group_state_file = f'{recover_dir}/groupByfund.state'
+stats_file = f'{recover_dir}/groupByfund.stats'
+rollup_file = f'{recover_dir}/groupByfund.rollup'
+corr_file = f'{recover_dir}/correlation.npz'
+db_file = f'{recover_dir}/jackson.sqlite'
+db_manifest_file = f'{recover_dir}/ingested.sqlite.json'
+db_by_fund_file = f'{recover_dir}/groupByfund.sqlite.json'
+# the ranking written by watch mode after each update.
+rank_file = f'{recover_dir}/ranked.json'
+# the page cache (see common_spt.py); None turns it off.
+page_cache_dir = f'{recover_dir}/pagecache'
+
+# fetching values pages over http (see fetch.py, python -m jackson fetch):
+# fetch_path is formatted with the date fields of fetch.url_fields. The
+# default serves the saved pages: python -m http.server -d recover 8000.
+# jackson.com needs the Cookie of a logged in session in fetch_headers.
+fetch_base_url = 'http://127.0.0.1:8000/'
+fetch_path = '{mmm}{dd}.html'
+fetch_headers = dict()
+fetch_concurrency = 8
+fetch_rate = None  # requests per second, None is unlimited
+fetch_retries = 3
+
+# also keep the rows of today's column of each values page, the day the
+# page was saved; False keeps only the selected date.
+today_rows = True
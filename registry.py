@@ -0,0 +1,198 @@
+# file: registry.py
+
+import json
+import os
+from bisect import bisect_right
+from collections import namedtuple
+from records import day
+
+# what a page's fund name is looked up to; name is the registry's name
+# with the spaces removed, as it is stored in the csv file.
+FundInfo = namedtuple('FundInfo', ['fundId', 'invested', 'allocated', 'name'],
+                      defaults=(None,))
+
+
+def normalize(name):
+    '''
+    'JNL/Mellon Energy Sector ' -> 'JNL/MellonEnergySector', the key of a
+    fund name however the page spaces it.
+    '''
+    return ''.join(name.split())
+
+
+class Fund:
+    '''
+    One subaccount of an account (or its total, fundId -999) with its
+    history of investments and allocations: periods is a list of
+    (from isodate or None, invested, allocated), and at(date) is the
+    FundInfo of the period that date falls in.
+    '''
+    __slots__ = ('fundId', 'name', 'key', 'units', 'days', 'infos')
+
+    def __init__(self, fundId, name, periods, units=None):
+        self.fundId = fundId
+        self.name = name
+        self.key = normalize(name)
+        self.units = units
+        periods = sorted(periods, key=lambda p: day(p[0]) if p[0] else 0)
+        self.days = [day(p[0]) if p[0] else 0 for p in periods]
+        self.infos = [FundInfo(fundId, p[1], p[2], self.key)
+                      for p in periods]
+
+    @classmethod
+    def from_json(cls, entry):
+        '''
+        {'fundId', 'name', 'invested', 'allocated'} or, when they changed,
+        {'fundId', 'name', 'history': [{'from', 'invested', 'allocated'}]},
+        and 'units' for the total: a number, or {layout name: number} when
+        each page layout wrote its own, see units_of.
+        '''
+        periods = [(p.get('from'), p['invested'], p['allocated'])
+                   for p in entry.get('history', [entry])]
+        return cls(entry['fundId'], entry['name'], periods,
+                   entry.get('units'))
+
+    def units_of(self, layout):
+        '''
+        the units written in the rows of the layout named layout (see
+        layouts.py), eg: the values pages have always written 81 units in
+        the JacksonFunds row and the details pages 2769.
+        '''
+        if isinstance(self.units, dict):
+            return self.units[layout]
+        return self.units
+
+    def at(self, date=None):
+        '''
+        FundInfo on date (isodate or ordinal), the latest one for None.
+        '''
+        if date is None or len(self.infos) == 1:
+            return self.infos[-1]
+        return self.infos[max(bisect_right(self.days, day(date)) - 1, 0)]
+
+
+class Account:
+    '''
+    One policy: its total (fundId -999, the 'JacksonFunds' row) and funds.
+    find(text) looks up the fund of a grid cell text through index, keyed
+    by the raw text: the first time a text is seen it is normalized and
+    looked up in by_key, the precomputed normalized-name index, and the
+    answer (None for an untracked fund) is kept, so each cell costs one
+    dict lookup however many pages are read.
+    '''
+
+    def __init__(self, name, total, funds, policy=''):
+        self.name = name
+        self.policy = policy
+        self.total = total
+        self.funds = list(funds)
+        self.by_key = {f.key: f for f in self.funds}
+        self.by_id = {f.fundId: f for f in self.funds}
+        self.index = dict()
+
+    @classmethod
+    def from_json(cls, name, entry):
+        return cls(name, Fund.from_json(entry['total']),
+                   [Fund.from_json(f) for f in entry['funds']],
+                   entry.get('policy', ''))
+
+    @classmethod
+    def from_lookup(cls, name, lookupfund, units=None):
+        '''
+        an Account of a {normalized name: FundInfo} dict, the old
+        lookupfund, whose 'JacksonFunds' entry is the total.
+        '''
+        total = lookupfund['JacksonFunds']
+        funds = [Fund(info.fundId, key, [(None, info.invested,
+                                          info.allocated)])
+                 for key, info in lookupfund.items()
+                 if key != 'JacksonFunds' and info.fundId is not None]
+        return cls(name, Fund(total.fundId, 'JacksonFunds',
+                              [(None, total.invested, total.allocated)],
+                              units), funds)
+
+    def find(self, text):
+        '''
+        the Fund of a page's fund name text, or None if it is not tracked.
+        '''
+        try:
+            return self.index[text]
+        except KeyError:
+            fund = self.index[text] = self.by_key.get(normalize(text))
+            return fund
+
+    def lookup(self, text, date=None):
+        '''
+        FundInfo of the fund named text on date, or None.
+        '''
+        fund = self.find(text)
+        return None if fund is None else fund.at(date)
+
+    def names(self):
+        '''
+        {fundId: name} of the funds and the total, eg: for chart titles.
+        '''
+        names = {f.fundId: f.key for f in self.funds}
+        names[self.total.fundId] = self.total.key
+        return names
+
+    def lookupfund(self):
+        '''
+        {normalized name: FundInfo} of the latest period of every fund and
+        the total as 'JacksonFunds', the old spt.lookupfund.
+        '''
+        lookup = {f.key: f.at() for f in self.funds}
+        lookup['JacksonFunds'] = self.total.at()
+        return lookup
+
+
+class Registry:
+    '''
+    The accounts of a registry file (see funds.json):
+    {'default': account name,
+     'accounts': {name: {'policy', 'total': fund, 'funds': [fund, ...]}}}
+    where a fund is as Fund.from_json reads it. account(None) is the
+    default account.
+    '''
+
+    def __init__(self, accounts, default):
+        self.accounts = accounts
+        self.default = default
+
+    def account(self, name=None):
+        name = name or self.default
+        if name not in self.accounts:
+            raise KeyError(f'no account {name!r} in the registry, '
+                           f'known: {sorted(self.accounts)}')
+        return self.accounts[name]
+
+    def path(self, path, name=None):
+        '''
+        where the account keeps the file path: path itself for the default
+        account, else <path's directory>/<name>/<basename>, so every
+        account has its own csv, json, manifest and database.
+        '''
+        if not name or name == self.default:
+            return path
+        head, tail = os.path.split(path)
+        return os.path.join(head, name, tail)
+
+    def directory(self, path, name=None):
+        '''
+        where the account's pages are saved: path for the default account,
+        else path/<name>, the directory its files go to (see path()).
+        '''
+        if not name or name == self.default:
+            return path
+        return os.path.join(path, name)
+
+
+def load(path):
+    '''
+    the Registry of the json file path.
+    '''
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    accounts = {name: Account.from_json(name, entry)
+                for name, entry in data['accounts'].items()}
+    return Registry(accounts, data.get('default') or next(iter(accounts)))
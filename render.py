@@ -0,0 +1,141 @@
+# file: render.py
+
+import os
+import numpy as np
+from records import EPOCH
+
+# figure size in inches and dots per inch of the batch charts
+SIZE = (10, 6)
+DPI = 100
+FORMATS = ('png', 'svg')
+
+
+def downsample(x, y, pixels):
+    '''
+    Keeps at most about pixels points of the series x, y (numpy arrays, x
+    sorted): the points are cut into pixels/2 buckets of equal count and the
+    min and the max of each bucket are kept, in x order, with the first and
+    last point. Peaks and dips survive, unlike taking every n-th point.
+    Shorter series are returned as they are.
+    '''
+    n = len(y)
+    if n <= pixels or n < 3:
+        return x, y
+    k = -(-n // max(pixels // 2, 1))  # points per bucket
+    b = -(-n // k)                     # buckets, the last one padded
+    pad = b * k - n
+    lo = np.concatenate([y, np.full(pad, np.inf)]).reshape(b, k)
+    hi = np.concatenate([y, np.full(pad, -np.inf)]).reshape(b, k)
+    start = np.arange(b) * k
+    keep = np.concatenate([[0, n - 1], start + lo.argmin(axis=1),
+                           start + hi.argmax(axis=1)])
+    keep = np.unique(keep)
+    return x[keep], y[keep]
+
+
+def series(gbf, field='nvalues'):
+    '''
+    (dates, values) of a GroupByFund as numpy arrays, dates as datetime64
+    days, so matplotlib puts them on a real date axis.
+    '''
+    days = np.asarray(gbf.days, dtype=np.int64) - EPOCH
+    return (days.astype('datetime64[D]'),
+            np.asarray(getattr(gbf, field), dtype=float))
+
+
+def pixels(ax):
+    '''
+    width of the axes in device pixels, the most points worth drawing.
+    '''
+    fig = ax.figure
+    return max(int(ax.get_position().width * fig.get_figwidth() * fig.dpi), 2)
+
+
+def date_axis(ax):
+    import matplotlib.dates as mdates
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+
+def draw_portfolio(ax, groupbyfund):
+    '''
+    The family of normalized value curves, one per fund, with the
+    JacksonFunds total (-999) in red, each curve labelled with its fundId
+    at the start and its last value at the end, and the break-even line
+    at 1.0 across all dates.
+    '''
+    width = pixels(ax)
+    for k, v in groupbyfund.items():
+        if not len(v):
+            continue
+        X, Y = downsample(*series(v), width)
+        lbl = f'{k}'
+        pct = f'{k}-{round(v.nvalues[-1]*100, 2)}%'
+        ax.annotate(lbl, (X[0], Y[0]))
+        ax.annotate(pct, (X[-1], Y[-1]))
+        if k == -999:
+            # make the Jackson overall plot stand out.
+            ax.plot(X, Y, "ro-", ms=4, markevery=max(len(X) // 50, 1),
+                    label=lbl)
+        else:
+            ax.plot(X, Y, label=lbl)
+    ax.axhline(1.0, color='k', label='Break-Even')
+    ax.set_ylabel('normalized $')
+    ax.set_xlabel('Date')
+    ax.set_title('Jackson Fund performance, normalized')
+    date_axis(ax)
+
+
+def draw_fund(ax, gbf, name=''):
+    '''
+    One fund: its value in $ on the left axis and the normalized value,
+    with the break-even line, on the right.
+    '''
+    width = pixels(ax)
+    X, Y = downsample(*series(gbf, 'values'), width)
+    ax.plot(X, Y, 'b-', lw=1)
+    ax.axhline(gbf.invested, color='k', lw=0.8)
+    ax.set_ylabel('value $')
+    X, Y = downsample(*series(gbf), width)
+    ax2 = ax.twinx()
+    ax2.plot(X, Y, lw=0)  # only sets the scale of the normalized axis
+    lo, hi = ax.get_ylim()
+    ax2.set_ylim(lo / gbf.invested, hi / gbf.invested)
+    ax2.set_ylabel('normalized $')
+    ax.set_title(f'{gbf.fundId} {name} {round(gbf.nvalues[-1]*100, 2)}%')
+    date_axis(ax)
+
+
+def new_figure(size=SIZE, dpi=DPI):
+    '''
+    A Figure drawn by the Agg canvas, without pyplot, so no display is
+    needed and nothing is kept in pyplot's list of open figures.
+    '''
+    from matplotlib.figure import Figure
+    return Figure(figsize=size, dpi=dpi, constrained_layout=True)
+
+
+def render_all(groupbyfund, out_dir, fmt='png', names=None, size=SIZE,
+               dpi=DPI):
+    '''
+    Writes out_dir/portfolio.<fmt> and one out_dir/fund<fundId>.<fmt> per
+    fund. names is {fundId: name} for the titles. Returns the file paths.
+    '''
+    if fmt not in FORMATS:
+        raise ValueError(f'fmt must be one of {FORMATS}')
+    os.makedirs(out_dir, exist_ok=True)
+    names = names or dict()
+    paths = []
+    fig = new_figure(size, dpi)
+    draw_portfolio(fig.subplots(), groupbyfund)
+    paths.append(os.path.join(out_dir, f'portfolio.{fmt}'))
+    fig.savefig(paths[-1])
+    for k, v in groupbyfund.items():
+        if not len(v):
+            continue
+        fig = new_figure(size, dpi)
+        draw_fund(fig.subplots(), v, names.get(k, ''))
+        paths.append(os.path.join(out_dir, f'fund{k}.{fmt}'))
+        fig.savefig(paths[-1])
+    return paths
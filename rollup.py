@@ -0,0 +1,285 @@
+# file: rollup.py
+
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from group_cache import GroupCache
+from records import GroupByFund, day, isodate
+
+
+def week(d):
+    '''
+    day ordinal of the monday of the week of day ordinal d.
+    '''
+    return d - (d - 1) % 7
+
+
+def month(d):
+    x = datetime.date.fromordinal(d)
+    return datetime.date(x.year, x.month, 1).toordinal()
+
+
+def quarter(d):
+    x = datetime.date.fromordinal(d)
+    return datetime.date(x.year, (x.month - 1) // 3 * 3 + 1, 1).toordinal()
+
+
+def year(d):
+    return datetime.date(datetime.date.fromordinal(d).year, 1, 1).toordinal()
+
+
+def inception(d):
+    return 0
+
+
+# the first day of the bucket a day ordinal falls in, for each period;
+# 'year' holds the year to date and 'all' the history since inception
+PERIODS = {'week': week, 'month': month, 'quarter': quarter, 'year': year,
+           'all': inception}
+# days a bucket of each resolution spans, finest first, to pick the
+# resolution of a date range (see pick)
+SPANS = {'day': 7 / 5, 'week': 7, 'month': 365.25 / 12,
+         'quarter': 365.25 / 4}
+FIELDS = ('nopen', 'nclose', 'nmin', 'nmax', 'nsum',
+          'vopen', 'vclose', 'vmin', 'vmax', 'vsum')
+
+
+def pick(start, end, points):
+    '''
+    The finest resolution ('day', 'week', 'month' or 'quarter') that has at
+    most points buckets between the day ordinals start and end, so a chart
+    of the range gets as much detail as it can show; 'quarter' if none.
+    '''
+    for res, span in SPANS.items():
+        if (end - start + 1) / span <= points:
+            return res
+    return 'quarter'
+
+
+class Bars:
+    '''
+    One fund's rows rolled up into the buckets of a period (see PERIODS):
+    for each bucket its first day (starts), the first and last days with
+    a row (firsts, ends), the number of rows n, and the open, close, min,
+    max and sum of the nvalues (n*) and values (v*). The fields are typed
+    arrays, like those of GroupByFund. add() takes a row of a day the bars
+    do not hold yet, in any order: a later day updates the last bucket or
+    starts the next one in O(1), an earlier one finds its bucket by
+    bisection.
+    '''
+    __slots__ = ('period', 'starts', 'firsts', 'ends', 'n') + FIELDS
+
+    def __init__(self, period, starts=(), firsts=(), ends=(), n=(),
+                 *fields):
+        self.period = period
+        self.starts = array('i', starts)
+        self.firsts = array('i', firsts)
+        self.ends = array('i', ends)
+        self.n = array('i', n)
+        for f, values in zip(FIELDS, fields or [()] * len(FIELDS)):
+            setattr(self, f, array('d', values))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, d, value, nvalue):
+        b = PERIODS[self.period](d)
+        i = len(self.starts) - 1
+        if i < 0 or self.starts[i] < b:
+            self.new_bucket(i + 1, b, d, value, nvalue)
+            return
+        if self.starts[i] > b:
+            i = bisect_left(self.starts, b)
+            if self.starts[i] != b:
+                self.new_bucket(i, b, d, value, nvalue)
+                return
+        self.n[i] += 1
+        self.nmin[i] = min(self.nmin[i], nvalue)
+        self.nmax[i] = max(self.nmax[i], nvalue)
+        self.nsum[i] += nvalue
+        self.vmin[i] = min(self.vmin[i], value)
+        self.vmax[i] = max(self.vmax[i], value)
+        self.vsum[i] += value
+        if d > self.ends[i]:
+            self.ends[i] = d
+            self.nclose[i] = nvalue
+            self.vclose[i] = value
+        if d < self.firsts[i]:
+            self.firsts[i] = d
+            self.nopen[i] = nvalue
+            self.vopen[i] = value
+
+    def new_bucket(self, i, b, d, value, nvalue):
+        '''
+        a bucket of one row at index i: an append for a later bucket, an
+        insert that shifts the later buckets (not the rows) otherwise.
+        '''
+        self.starts.insert(i, b)
+        self.firsts.insert(i, d)
+        self.ends.insert(i, d)
+        self.n.insert(i, 1)
+        for f in ('nopen', 'nclose', 'nmin', 'nmax', 'nsum'):
+            getattr(self, f).insert(i, nvalue)
+        for f in ('vopen', 'vclose', 'vmin', 'vmax', 'vsum'):
+            getattr(self, f).insert(i, value)
+
+    def index(self, start=None, end=None):
+        '''
+        (i, j) such that buckets i to j hold the rows between the day
+        ordinals start and end (None is unbounded), by bisection.
+        '''
+        i = bisect_left(self.ends, start) if start is not None else 0
+        j = bisect_right(self.starts, end) if end is not None \
+            else len(self.starts)
+        return i, max(i, j)
+
+    def bar(self, i=-1):
+        '''
+        bucket i as {'start', 'end' (isodates), 'n', 'nopen', 'nclose',
+        'nmin', 'nmax', 'nmean', 'vopen', ..., 'vmean'}.
+        '''
+        bar = {'start': isodate(self.starts[i]) if self.starts[i] else None,
+               'end': isodate(self.ends[i]), 'n': self.n[i]}
+        for f in FIELDS:
+            bar[f] = getattr(self, f)[i]
+        bar['nmean'] = bar.pop('nsum') / self.n[i]
+        bar['vmean'] = bar.pop('vsum') / self.n[i]
+        return bar
+
+    def to_list(self):
+        return [self.starts.tolist(), self.firsts.tolist(),
+                self.ends.tolist(), self.n.tolist()] \
+            + [getattr(self, f).tolist() for f in FIELDS]
+
+
+class FundRollup:
+    '''
+    The rollup pyramid of one fund: its Bars of every period, fed by the
+    fund's rows. Rows of days before last_day (a page scraped out of
+    order, the today rows of a values page saved before the older pages
+    are) go into their buckets, at a cost of a bisection each. seen is a
+    bitmap of the days added, one bit a day from the day ordinal origin,
+    so add() can tell a new day from one it already holds: it returns
+    False for the latter (a re-saved page), whose old row cannot be taken
+    out of the sums; the pyramid must then be built again from the fund's
+    history, see of().
+    '''
+    __slots__ = ('fundId', 'invested', 'last_day', 'bars', 'origin',
+                 'seen')
+
+    def __init__(self, fundId, invested, last_day=0, bars=None, origin=0,
+                 seen=b''):
+        self.fundId = fundId
+        self.invested = invested
+        self.last_day = last_day
+        self.bars = bars or {p: Bars(p) for p in PERIODS}
+        self.origin = origin
+        self.seen = bytearray(seen)
+
+    @classmethod
+    def of(cls, g):
+        '''
+        the pyramid of a whole GroupByFund.
+        '''
+        rollup = cls(g.fundId, g.invested)
+        for d, v, nv in zip(g.days, g.values, g.nvalues):
+            rollup.add(d, v, nv)
+        return rollup
+
+    def mark(self, d):
+        '''
+        sets the bit of day ordinal d in seen; False if it was set.
+        '''
+        if not self.seen:
+            self.origin = d - d % 8
+        elif d < self.origin:
+            grow = (self.origin - d + 7) // 8
+            self.seen[:0] = bytes(grow)
+            self.origin -= 8 * grow
+        i, bit = divmod(d - self.origin, 8)
+        if i >= len(self.seen):
+            self.seen.extend(bytes(i + 1 - len(self.seen)))
+        if self.seen[i] >> bit & 1:
+            return False
+        self.seen[i] |= 1 << bit
+        return True
+
+    def add(self, d, value, nvalue):
+        if not self.mark(d):
+            return False
+        for bars in self.bars.values():
+            bars.add(d, value, nvalue)
+        self.last_day = max(self.last_day, d)
+        return True
+
+    def group(self, period, start=None, end=None):
+        '''
+        a GroupByFund of the closes of the period's buckets between the
+        day ordinals start and end, dated on the last day of each bucket,
+        eg: to plot years of history as weekly points.
+        '''
+        bars = self.bars[period]
+        i, j = bars.index(start, end)
+        return GroupByFund(self.fundId, self.invested, '', '',
+                           bars.ends[i:j], bars.vclose[i:j],
+                           bars.nclose[i:j])
+
+    def to_list(self):
+        return [self.invested, self.last_day,
+                {p: b.to_list() for p, b in self.bars.items()},
+                self.origin, self.seen.hex()]
+
+    @classmethod
+    def from_list(cls, fundId, fields):
+        invested, last_day, bars, origin, seen = fields
+        return cls(fundId, invested, last_day,
+                   {p: Bars(p, *b) for p, b in bars.items()}, origin,
+                   bytes.fromhex(seen))
+
+
+def push_rows(rollups, rows):
+    '''
+    Adds csv rows (see group_csv) to rollups {fundId: FundRollup}, in any
+    date order. Returns the fundIds that got a row of a day they already
+    held, whose pyramid must be built again (FundRollup.of).
+    '''
+    late = set()
+    for row in rows:
+        fid = int(row[0])
+        r = rollups.get(fid)
+        if r is None:
+            r = rollups[fid] = FundRollup(fid, float(row[2]))
+        if fid in late:
+            continue
+        value = float(row[7])
+        if not r.add(day(row[9]), value, round(value / float(row[2]), 3)):
+            late.add(fid)
+    return late
+
+
+class RollupCache(GroupCache):
+    '''
+    Keeps the {fundId: FundRollup} of the csv rows in rollup_file, with
+    the csv offset they cover, as StatsCache keeps the running statistics
+    (see running.py): load() returns them and the rows appended since.
+    '''
+
+    def __init__(self, csv_file, rollup_file):
+        super().__init__(csv_file, rollup_file, rollup_file, None)
+
+    # bump when the saved form of FundRollup changes
+    VERSION = 2
+
+    def valid(self, state, st):
+        return state is not None \
+            and state.get('rollup_version') == self.VERSION \
+            and super().valid(state, st)
+
+    def read_aggregate(self, state):
+        return {int(k): FundRollup.from_list(int(k), v)
+                for k, v in state['rollups'].items()}
+
+    def save(self):
+        super().save(rollup_version=self.VERSION,
+                     rollups={k: v.to_list()
+                              for k, v in self.aggregate.items()})
@@ -0,0 +1,142 @@
+# file: running.py
+
+import math
+from collections import deque
+from group_cache import GroupCache
+from records import day
+
+# rows of each fund's history kept with its statistics, for the rolling
+# metrics of rank windows up to TAIL - 1 dates
+TAIL = 64
+
+
+class RunningStats:
+    '''
+    Running statistics of one fund's nvalues, pushed in date order:
+    Welford's mean and sum of squared deviations (m2) of the nvalues and
+    of the daily returns (rmean, rm2), the first and last nvalue for the
+    cumulative return, the running peak for the max drawdown, and the
+    last tail rows (day ordinal, nvalue) for the rolling metrics. push()
+    costs O(1) whatever the length of the history, and to_list() is a
+    fixed size, so ranking from them costs O(funds).
+    '''
+    __slots__ = ('fundId', 'n', 'mean', 'm2', 'rn', 'rmean', 'rm2',
+                 'first', 'last', 'last_day', 'peak', 'max_drawdown',
+                 'tail')
+
+    def __init__(self, fundId, tail=TAIL):
+        self.fundId = fundId
+        self.n = self.rn = 0
+        self.mean = self.m2 = self.rmean = self.rm2 = 0.0
+        self.first = self.last = self.peak = math.nan
+        self.last_day = 0
+        self.max_drawdown = 0.0
+        self.tail = deque(maxlen=tail)
+
+    @classmethod
+    def of(cls, g, tail=TAIL):
+        '''
+        the statistics of a whole GroupByFund, pushed row by row.
+        '''
+        stats = cls(g.fundId, tail)
+        for d, nv in zip(g.days, g.nvalues):
+            stats.push(d, nv)
+        return stats
+
+    def push(self, d, nvalue):
+        '''
+        add the nvalue of day ordinal d, a later day than last_day.
+        '''
+        self.n += 1
+        delta = nvalue - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (nvalue - self.mean)
+        if self.n == 1:
+            self.first = self.peak = nvalue
+        else:
+            r = nvalue / self.last - 1
+            self.rn += 1
+            delta = r - self.rmean
+            self.rmean += delta / self.rn
+            self.rm2 += delta * (r - self.rmean)
+            self.peak = max(self.peak, nvalue)
+            self.max_drawdown = min(self.max_drawdown, nvalue / self.peak - 1)
+        self.last = nvalue
+        self.last_day = d
+        self.tail.append((d, nvalue))
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else math.nan
+
+    @property
+    def mean_return(self):
+        return self.rmean if self.rn else math.nan
+
+    @property
+    def stdev_return(self):
+        return math.sqrt(self.rm2 / (self.rn - 1)) if self.rn > 1 \
+            else math.nan
+
+    def to_list(self):
+        return [self.n, self.mean, self.m2, self.rn, self.rmean, self.rm2,
+                self.first, self.last, self.last_day, self.peak,
+                self.max_drawdown, [list(t) for t in self.tail]]
+
+    @classmethod
+    def from_list(cls, fundId, fields, tail=TAIL):
+        stats = cls(fundId, tail)
+        (stats.n, stats.mean, stats.m2, stats.rn, stats.rmean, stats.rm2,
+         stats.first, stats.last, stats.last_day, stats.peak,
+         stats.max_drawdown, rows) = fields
+        stats.tail.extend(tuple(t) for t in rows)
+        return stats
+
+
+def push_rows(stats, rows, tail=TAIL):
+    '''
+    Pushes csv rows (see group_csv) into stats {fundId: RunningStats}.
+    Returns the fundIds that got a row dated on or before their last day,
+    eg: a page scraped out of order; their statistics must be built again
+    from the whole history (RunningStats.of).
+    '''
+    late = set()
+    for row in rows:
+        fid = int(row[0])
+        d = day(row[9])
+        s = stats.get(fid)
+        if s is None:
+            s = stats[fid] = RunningStats(fid, tail)
+        if fid in late:
+            continue
+        if s.n and d <= s.last_day:
+            late.add(fid)
+            continue
+        s.push(d, round(float(row[7]) / float(row[2]), 3))
+    return late
+
+
+class StatsCache(GroupCache):
+    '''
+    Keeps the {fundId: RunningStats} of the csv rows in stats_file, with
+    the csv offset they cover, as GroupCache keeps groupByfund.json: load()
+    returns them and only the rows appended since, and a rewritten csv
+    starts them over. The statistics are small, so they are saved in the
+    state file itself.
+    '''
+
+    def __init__(self, csv_file, stats_file, tail=TAIL):
+        super().__init__(csv_file, stats_file, stats_file, None)
+        self.tail = tail
+
+    def valid(self, state, st):
+        return state is not None and state.get('tail_rows') == self.tail \
+            and super().valid(state, st)
+
+    def read_aggregate(self, state):
+        return {int(k): RunningStats.from_list(int(k), v, self.tail)
+                for k, v in state['stats'].items()}
+
+    def save(self):
+        super().save(tail_rows=self.tail,
+                     stats={k: v.to_list() for k, v in self.aggregate.items()})
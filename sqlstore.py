@@ -0,0 +1,163 @@
+# file: sqlstore.py
+
+import csv
+import sqlite3
+
+FIELDS = ['fundId', 'name', 'invested', 'allocated', 'future_pct',
+          'actual_pct', 'num_units', 'unit_value', 'value', 'nvalue', 'date']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fund_rows (
+    fundId INTEGER NOT NULL,
+    name TEXT,
+    invested REAL,
+    allocated TEXT,
+    future_pct TEXT,
+    actual_pct TEXT,
+    num_units REAL,
+    unit_value REAL,
+    value REAL,
+    nvalue REAL,
+    date TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS fund_date ON fund_rows (fundId, date);
+CREATE INDEX IF NOT EXISTS by_date ON fund_rows (date);
+'''
+
+
+class SqlStore:
+    '''
+    SQLite storage for the JacksonFund rows that read_page() produces.
+    One row per (fundId, date), enforced by a unique index, so saving a
+    re-scraped page replaces its rows (upsert). The indexes on
+    (fundId, date) and date make a date range or one fund's series an
+    index range scan instead of a pass over the whole history.
+    Dates are isodates, so they compare and sort as text.
+    The connection is closed by close() or at the end of a with block:
+    with rj.sql_store() as store: store.rows(...)
+    '''
+
+    def __init__(self, db_file, JacksonFund):
+        self.db_file = db_file
+        self.JacksonFund = JacksonFund
+        self.db = sqlite3.connect(db_file)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def count(self):
+        return self.db.execute('SELECT count(*) FROM fund_rows').fetchone()[0]
+
+    def upsert(self, jfs):
+        '''
+        Insert the JacksonFund records jfs in one transaction, replacing the
+        rows that have the same (fundId, date).
+        '''
+        cols = ', '.join(FIELDS)
+        marks = ', '.join('?' * len(FIELDS))
+        sets = ', '.join(f'{f} = excluded.{f}' for f in FIELDS[1:-1])
+        with self.db:
+            self.db.executemany(
+                f'INSERT INTO fund_rows ({cols}) VALUES ({marks}) '
+                f'ON CONFLICT (fundId, date) DO UPDATE SET {sets}',
+                [jf.row() for jf in jfs])
+
+    def values(self, dates):
+        '''
+        {(fundId, isodate): value} of the rows dated on one of dates, by
+        the date index.
+        '''
+        dates = list(dates)
+        if not dates:
+            return dict()
+        cur = self.db.execute(f'SELECT fundId, date, value FROM fund_rows '
+                              f'WHERE date IN ({", ".join("?" * len(dates))})',
+                              dates)
+        return {(fid, d): v for fid, d, v in cur}
+
+    def import_csv(self, csv_file, isodate):
+        '''
+        Loads an existing detailsByDate.csv. The csv has no allocated
+        column, so allocated is set to future_pct as group_by_fund() does.
+        '''
+        jfs = []
+        with open(csv_file, 'r', newline='') as file:
+            for row in csv.reader(file):
+                iv = float(row[2])
+                val = float(row[7])
+                jfs.append(self.JacksonFund(
+                    int(row[0]), row[1], iv, row[3], row[3], row[4],
+                    float(row[5]), float(row[6]), val, round(val / iv, 3),
+                    isodate(row[9])))
+        self.upsert(jfs)
+
+    def where(self, start=None, end=None, fundId=None):
+        '''
+        sql WHERE clause and its parameters for an inclusive date range
+        and/or one fund. None means unbounded.
+        '''
+        terms = []
+        params = []
+        if fundId is not None:
+            terms.append('fundId = ?')
+            params.append(fundId)
+        if start is not None:
+            terms.append('date >= ?')
+            params.append(start)
+        if end is not None:
+            terms.append('date <= ?')
+            params.append(end)
+        clause = f' WHERE {" AND ".join(terms)}' if terms else ''
+        return clause, params
+
+    def rows(self, start=None, end=None, fundId=None):
+        '''
+        JacksonFund records between the isodates start and end (inclusive),
+        optionally of one fund, in date order.
+        eg: store.rows('2022-09-05', '2022-09-20', 222)
+        '''
+        clause, params = self.where(start, end, fundId)
+        cur = self.db.execute(f'SELECT {", ".join(FIELDS)} FROM fund_rows'
+                              f'{clause} ORDER BY date, rowid', params)
+        return [self.JacksonFund(*r) for r in cur]
+
+    def series(self, fundId, start=None, end=None):
+        '''
+        (dates, values, nvalues) lists of one fund, in date order.
+        '''
+        clause, params = self.where(start, end, fundId)
+        cur = self.db.execute(f'SELECT date, value, nvalue FROM fund_rows'
+                              f'{clause} ORDER BY date', params)
+        dates, values, nvalues = [], [], []
+        for d, v, nv in cur:
+            dates.append(d)
+            values.append(v)
+            nvalues.append(nv)
+        return dates, values, nvalues
+
+    def group_by_fund(self, GroupByFund, start=None, end=None):
+        '''
+        {fundId: GroupByFund} for the rows between start and end, built the
+        same way group_by_fund() builds it from the csv file.
+        '''
+        # allocated and percent come from each fund's first row ever, as
+        # in the csv grouping; sqlite takes bare columns from the min() row
+        first = {r[0]: r[1:] for r in self.db.execute(
+            'SELECT fundId, future_pct, actual_pct, min(date) '
+            'FROM fund_rows GROUP BY fundId')}
+        groupbyfund = dict()
+        for jf in self.rows(start, end):
+            gbf = groupbyfund.get(jf.fundId)
+            if gbf is None:
+                gbf = GroupByFund(jf.fundId, jf.invested, first[jf.fundId][0],
+                                  first[jf.fundId][1], [], [], [])
+                groupbyfund[jf.fundId] = gbf
+            gbf.append(jf.day, jf.value, round(jf.value / jf.invested, 3))
+        return groupbyfund
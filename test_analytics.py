@@ -0,0 +1,90 @@
+# file: test_analytics.py
+
+import numpy as np
+import analytics
+from metrics import metrics
+from recover import RecoverJackson
+from records import GroupByFund
+from testdata import read_rows, write_rows
+
+
+def random_groups(n_funds=5, n_dates=120, seed=1):
+    '''
+    {fundId: GroupByFund} of random walks, each missing some dates.
+    '''
+    rng = np.random.default_rng(seed)
+    groups = dict()
+    for fid in range(n_funds):
+        days = np.arange(738000, 738000 + n_dates)
+        keep = rng.random(n_dates) > 0.15
+        nv = np.cumprod(1 + rng.normal(0, 0.01, n_dates))[keep]
+        groups[fid] = GroupByFund(fid, 1000.0, '', '', days[keep].tolist(),
+                                  (nv * 1000).tolist(), nv.tolist())
+    return groups
+
+
+def pairwise(R):
+    '''
+    np.cov and np.corrcoef of each pair of rows of R over the dates both
+    have a return.
+    '''
+    n = len(R)
+    cov, corr = np.full((n, n), np.nan), np.full((n, n), np.nan)
+    for i in range(n):
+        for j in range(n):
+            both = ~np.isnan(R[i]) & ~np.isnan(R[j])
+            if both.sum() > 1:
+                cov[i, j] = np.cov(R[i][both], R[j][both])[0, 1]
+                corr[i, j] = np.corrcoef(R[i][both], R[j][both])[0, 1]
+    return cov, corr
+
+
+def test_correlate_matches_numpy_per_window():
+    groups, window = random_groups(), 20
+    result = analytics.correlate(groups, window)
+    _, days, M = analytics.fund_matrix(groups)
+    R = np.full(M.shape, np.nan)
+    R[:, 1:] = analytics.daily_returns(M)
+    cov, corr = pairwise(R)
+    np.testing.assert_allclose(result['cov'], cov, equal_nan=True)
+    np.testing.assert_allclose(result['corr'], corr, equal_nan=True)
+    assert np.isnan(result['roll_corr'][:window - 1]).all()
+    for j in range(window - 1, len(days)):
+        # the window of dates ending at j holds the returns of j-window+2..j
+        cov, corr = pairwise(R[:, j - window + 2:j + 1])
+        np.testing.assert_allclose(result['roll_cov'][j], cov,
+                                   atol=1e-12, equal_nan=True)
+        np.testing.assert_allclose(result['roll_corr'][j], corr,
+                                   atol=1e-9, equal_nan=True)
+
+
+def test_result_cache_keeps_one_key(tmp_path):
+    path = str(tmp_path / 'corr.npz')
+    cache = analytics.ResultCache(path)
+    assert cache.get('a') is None
+    cache.put('a', {'x': np.arange(3)})
+    # a new cache reads the file, only for the key it was saved with
+    assert analytics.ResultCache(path).get('a')['x'].tolist() == [0, 1, 2]
+    assert analytics.ResultCache(path).get('b') is None
+    assert cache.get('b') is None
+
+
+def cached(rj, window=5):
+    rj.correlate(window, out=f'{rj.corr_file}.json')
+    return [e['cached'] for e in metrics.events
+            if e.get('stage') == 'correlate'][-1]
+
+
+def test_correlate_is_computed_again_after_an_ingest(tmp_path):
+    rows = read_rows()
+    rj = RecoverJackson(workdir=str(tmp_path))
+    write_rows(rj.csv_file, rows[:-9])
+    version = rj.data_version()
+    assert cached(rj) is False
+    assert cached(rj) is True
+    assert cached(RecoverJackson(workdir=str(tmp_path))) is True
+    assert cached(rj, window=6) is False
+    write_rows(rj.csv_file, rows[-9:])
+    assert rj.data_version() != version
+    assert cached(rj) is False
+    assert cached(rj) is True
@@ -0,0 +1,66 @@
+# file: test_batch_writer.py
+
+import os
+from batch_writer import CsvBatchWriter
+from testdata import fund, read_rows as rows
+
+
+def test_append_writes_the_rows(tmp_path):
+    csv_file = str(tmp_path / 'detailsByDate.csv')
+    writer = CsvBatchWriter(csv_file)
+    writer.extend([fund(190, 8787.48, '2022-09-23'),
+                   fund(66, 8288.03, '2022-09-23')])
+    writer.append()
+    assert rows(csv_file) == [
+        ['190', 'JNL/MellonEnergySector', '9000', '15%', '14%',
+         '223.2304', '39.365075', '8787.48', '0.976', '2022-09-23'],
+        ['66', 'JNL/MellonEnergySector', '9000', '15%', '14%', '223.2304',
+         '39.365075', '8288.03', '0.921', '2022-09-23']]
+    assert not os.path.exists(writer.journal_file)
+
+
+def test_recover_replays_an_interrupted_append(tmp_path):
+    csv_file = str(tmp_path / 'detailsByDate.csv')
+    writer = CsvBatchWriter(csv_file)
+    writer.add(fund(190, 8787.48, '2022-09-22'))
+    writer.append()
+    size = os.path.getsize(csv_file)
+    # the process died after writing the journal and half of the rows
+    data = writer.text([writer.row(fund(190, 8800.0, '2022-09-23')),
+                        writer.row(fund(66, 8288.03, '2022-09-23'))])
+    with open(writer.journal_file, 'w', newline='') as journal:
+        journal.write(f'{size}\n{data}')
+    with open(csv_file, 'a', newline='') as file:
+        file.write(data[:len(data) // 2])
+    CsvBatchWriter(csv_file)
+    assert not os.path.exists(writer.journal_file)
+    assert [(r[0], r[9]) for r in rows(csv_file)] == [
+        ('190', '2022-09-22'), ('190', '2022-09-23'), ('66', '2022-09-23')]
+
+
+def test_upsert_appends_new_dates(tmp_path):
+    csv_file = str(tmp_path / 'detailsByDate.csv')
+    writer = CsvBatchWriter(csv_file)
+    writer.add(fund(190, 8787.48, '2022-09-23'))
+    writer.append()
+    ino = os.stat(csv_file).st_ino
+    writer.add(fund(190, 8800.0, '2022-09-22'))
+    writer.upsert({(190, '2022-09-23')})
+    assert os.stat(csv_file).st_ino == ino  # appended, not rewritten
+    assert [r[9] for r in rows(csv_file)] == ['2022-09-23', '2022-09-22']
+
+
+def test_upsert_replaces_a_fund_date(tmp_path):
+    csv_file = str(tmp_path / 'detailsByDate.csv')
+    writer = CsvBatchWriter(csv_file)
+    writer.extend([fund(190, 8787.48, '2022-09-22'),
+                   fund(66, 8288.03, '2022-09-22'),
+                   fund(190, 8800.0, '2022-09-23')])
+    writer.append()
+    writer.add(fund(190, 9000.0, '2022-09-22'))
+    writer.upsert({(190, '2022-09-22'), (66, '2022-09-22'),
+                   (190, '2022-09-23')})
+    assert [(r[0], r[7], r[9]) for r in rows(csv_file)] == [
+        ('66', '8288.03', '2022-09-22'), ('190', '8800.0', '2022-09-23'),
+        ('190', '9000.0', '2022-09-22')]
+    assert not os.path.exists(f'{csv_file}.tmp')
@@ -0,0 +1,123 @@
+# file: test_group_cache.py
+
+import glob
+import os
+import shutil
+from group_cache import GroupCache
+from recover import RecoverJackson
+from records import GroupByFund
+from testdata import HERE, read_rows, write_rows
+
+ROWS = ['190,JNL/MellonEnergySector,9000,15%,15%,223.2304,39.365075,'
+        f'{8700 + i}.0,0.97,2022-09-{i + 10}\n' for i in range(6)]
+
+
+def cache(tmp_path):
+    csv_file = tmp_path / 'detailsByDate.csv'
+    by_fund_file = tmp_path / 'groupByfund.json'
+    if not by_fund_file.exists():
+        by_fund_file.write_text('{}')
+    return GroupCache(str(csv_file), str(by_fund_file),
+                      str(tmp_path / 'groupByfund.state'), GroupByFund)
+
+
+def consume(tmp_path):
+    '''
+    the dates of the rows a new GroupCache reads, as the next run would,
+    then records that they were grouped.
+    '''
+    gc = cache(tmp_path)
+    _, rows = gc.load()
+    dates = [row[9] for row in rows]
+    gc.save()
+    return dates
+
+
+def test_append_reads_the_new_rows_only(tmp_path):
+    csv_file = tmp_path / 'detailsByDate.csv'
+    csv_file.write_text(''.join(ROWS[:4]))
+    assert consume(tmp_path) == ['2022-09-10', '2022-09-11', '2022-09-12',
+                                 '2022-09-13']
+    assert consume(tmp_path) == []
+    with open(csv_file, 'a') as file:
+        file.write(''.join(ROWS[4:]))
+    assert consume(tmp_path) == ['2022-09-14', '2022-09-15']
+
+
+def test_a_row_being_appended_waits(tmp_path):
+    csv_file = tmp_path / 'detailsByDate.csv'
+    csv_file.write_text(ROWS[0] + ROWS[1][:20])
+    assert consume(tmp_path) == ['2022-09-10']
+    with open(csv_file, 'a') as file:
+        file.write(ROWS[1][20:])
+    assert consume(tmp_path) == ['2022-09-11']
+
+
+def test_rewrite_in_place_reads_everything(tmp_path):
+    csv_file = tmp_path / 'detailsByDate.csv'
+    csv_file.write_text(''.join(ROWS[:4]))
+    consume(tmp_path)
+    # same inode and size, the last row replaced: the tail differs
+    with open(csv_file, 'r+') as file:
+        file.seek(len(''.join(ROWS[:3])))
+        file.write(ROWS[3].replace('8703.0', '8803.0'))
+    assert len(consume(tmp_path)) == 4
+
+
+def test_replaced_file_reads_everything(tmp_path):
+    csv_file = tmp_path / 'detailsByDate.csv'
+    csv_file.write_text(''.join(ROWS[:4]))
+    consume(tmp_path)
+    # an upsert renames a new file over the csv: same bytes, new inode
+    tmp = tmp_path / 'detailsByDate.csv.tmp'
+    tmp.write_text(''.join(ROWS[:4]))
+    os.replace(tmp, csv_file)
+    assert len(consume(tmp_path)) == 4
+
+
+def test_shorter_file_reads_everything(tmp_path):
+    csv_file = tmp_path / 'detailsByDate.csv'
+    csv_file.write_text(''.join(ROWS[:4]))
+    consume(tmp_path)
+    with open(csv_file, 'r+') as file:
+        file.truncate(len(''.join(ROWS[:2])))
+    assert consume(tmp_path) == ['2022-09-10', '2022-09-11']
+
+
+def test_sqlite_groups_leave_the_csv_groups(tmp_path):
+    pages = sorted(glob.glob(os.path.join(HERE, 'recover', '*.html')))
+    for page in pages:
+        shutil.copy(page, tmp_path)
+    rj = RecoverJackson(workdir=str(tmp_path))
+    rj.scrape_many_html(workers=1)
+    rj.group_by_fund()
+    n = len(rj.groupbyfund[635])
+    db = RecoverJackson(workdir=str(tmp_path), backend='sqlite')
+    db.scrape_files(str(tmp_path), [os.path.basename(p) for p in pages[:2]])
+    db.group_by_fund()
+    assert len(db.groupbyfund[635]) < n
+    rj = RecoverJackson(workdir=str(tmp_path))
+    rj.group_by_fund()
+    assert len(rj.groupbyfund[635]) == n
+
+
+def test_the_store_seeds_the_groups(tmp_path):
+    rows = read_rows()
+    rows[5][2] = '9500'  # invested is kept per row
+    rj = RecoverJackson(workdir=str(tmp_path))
+    write_rows(rj.csv_file, rows[:100])
+    rj.save_store()
+    write_rows(rj.csv_file, rows[100:])
+    # no groupByfund.json yet: the store and the rows after it are read
+    seeded = RecoverJackson(workdir=str(tmp_path))
+    seeded.group_by_fund()
+    os.remove(rj.store_file)
+    os.remove(rj.group_cache.state_file)
+    rj = RecoverJackson(workdir=str(tmp_path))
+    rj.group_by_fund()
+    assert {k: g.to_list() for k, g in seeded.groupbyfund.items()} == \
+        {k: g.to_list() for k, g in rj.groupbyfund.items()}
+    rj.save_store()
+    rj.load_store().to_csv(str(tmp_path / 'export.csv'))
+    assert [r[7] for r in read_rows(str(tmp_path / 'export.csv'))
+            if r[2] == '9500'] == [rows[5][7]]
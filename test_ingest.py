@@ -0,0 +1,94 @@
+# file: test_ingest.py
+
+import glob
+import os
+import shutil
+from ingest import merge_rows
+from metrics import metrics
+from recover import RecoverJackson
+from testdata import HERE, HISTORY, fund, read_rows
+
+
+def page(date, today, values):
+    '''
+    rows of a values page: its selected date, then today's column.
+    '''
+    return ([fund(fid, v, date) for fid, v in values.items()]
+            + [fund(fid, v + 100, today) for fid, v in values.items()])
+
+
+def keys(jfs):
+    return [(jf.fundId, jf.date, jf.value) for jf in jfs]
+
+
+def test_own_rows_win_over_today_rows():
+    # sep22 was saved later in the day than sep23, so its today rows
+    # disagree with sep23's own rows, which are kept whatever the order
+    sep22 = page('2022-09-22', '2022-09-23', {190: 8700.0})
+    sep23 = page('2022-09-23', '2022-09-23', {190: 8787.48})[:1]
+    for pages in ([('sep22', sep22), ('sep23', sep23)],
+                  [('sep23', sep23), ('sep22', sep22)]):
+        with metrics.scope() as counts:
+            merged = merge_rows(pages)
+        assert keys(merged) == [(190, '2022-09-22', 8700.0),
+                                (190, '2022-09-23', 8787.48)]
+        assert counts['merged_rows'] == counts['inconsistent_rows'] == 1
+
+
+def test_today_rows_fill_dates_no_page_selected():
+    sep22 = page('2022-09-22', '2022-09-26', {190: 8700.0, 66: 8288.03})
+    assert keys(merge_rows([('sep22', sep22)])) == [
+        (190, '2022-09-22', 8700.0), (66, '2022-09-22', 8288.03),
+        (190, '2022-09-26', 8800.0), (66, '2022-09-26', 8388.03)]
+
+
+def test_today_rows_skip_stored_keys():
+    sep22 = page('2022-09-22', '2022-09-26', {190: 8700.0, 66: 8288.03})
+    stored = {(190, '2022-09-26'): 8800.0}
+    assert keys(merge_rows([('sep22', sep22)], stored)) == [
+        (190, '2022-09-22', 8700.0), (66, '2022-09-22', 8288.03),
+        (66, '2022-09-26', 8388.03)]
+
+
+def test_csv_without_manifest_gets_no_duplicates(tmp_path):
+    for page in glob.glob(os.path.join(HERE, 'recover', '*.html')):
+        shutil.copy(page, tmp_path)
+    shutil.copy(HISTORY, tmp_path)
+    # the stored rows, not the missing ingested.json, tell what is stored
+    RecoverJackson(workdir=str(tmp_path)).scrape_many_html(workers=1)
+    rows = read_rows(str(tmp_path / 'detailsByDate.csv'))
+    keys = [(row[0], row[9]) for row in rows]
+    assert len(keys) == len(set(keys))
+    assert {tuple(row) for row in read_rows()} <= {tuple(r) for r in rows}
+    assert len(rows) > len(read_rows())  # dates the old csv did not have
+
+
+def test_stored_rows_are_compared():
+    sep22 = page('2022-09-22', '2022-09-23', {190: 8700.0, 66: 8288.03})
+    stored = {(190, '2022-09-22'): 8700.0, (66, '2022-09-22'): 8200.0,
+              (190, '2022-09-23'): 8800.0, (66, '2022-09-23'): 8300.0}
+    with metrics.scope() as counts:
+        merged = merge_rows([('sep22', sep22)], stored)
+    # the re-saved own row replaces the stored one, the disagreeing copy
+    # is reported and the stored row kept, the equal rows are left out
+    assert keys(merged) == [(66, '2022-09-22', 8288.03)]
+    assert counts['unchanged_rows'] == 2
+    assert counts['replaced_rows'] == counts['inconsistent_rows'] == 1
+
+
+def test_backfill_keeps_the_csv(tmp_path):
+    pages = sorted(glob.glob(os.path.join(HERE, 'recover', '*.html')))
+    for page in pages[9:]:
+        shutil.copy(page, tmp_path)
+    csv_file = str(tmp_path / 'detailsByDate.csv')
+    RecoverJackson(workdir=str(tmp_path)).scrape_many_html(workers=1)
+    ino = os.stat(csv_file).st_ino
+    # the older pages hold today rows already stored by the newer ones
+    for page in pages[:9]:
+        shutil.copy(page, tmp_path)
+    with metrics.scope() as counts:
+        RecoverJackson(workdir=str(tmp_path)).scrape_many_html(workers=1)
+    assert counts['unchanged_rows'] > 0
+    assert os.stat(csv_file).st_ino == ino  # appended, not rewritten
+    keys = [(row[0], row[9]) for row in read_rows(csv_file)]
+    assert len(keys) == len(set(keys))
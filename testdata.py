@@ -0,0 +1,35 @@
+# file: testdata.py
+
+import csv
+import os
+from records import JacksonFund
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# the rows RecoverJackson scraped from the pages in recover/
+HISTORY = os.path.join(HERE, 'recover', 'detailsByDate.csv')
+
+
+def fund(fundId, value, date):
+    '''
+    a JacksonFund row worth value on date; only fundId, value, nvalue and
+    the date vary, the other fields are those of one fund on one page.
+    '''
+    return JacksonFund(fundId, 'JNL/Mellon Energy Sector', 9000, '15%',
+                       '15%', '14%', 223.2304, 39.365075, value,
+                       round(value / 9000, 3), date)
+
+
+def read_rows(csv_file=HISTORY):
+    '''
+    the rows of a csv file as lists of text, by default of HISTORY.
+    '''
+    with open(csv_file, newline='') as file:
+        return list(csv.reader(file))
+
+
+def write_rows(csv_file, rows, mode='a'):
+    '''
+    writes rows as CsvBatchWriter does, appended by default.
+    '''
+    with open(csv_file, mode, newline='') as file:
+        csv.writer(file, lineterminator='\n').writerows(rows)
@@ -0,0 +1,214 @@
+# file: watch.py
+
+import os
+import select
+import signal
+import struct
+import time
+import archive
+from metrics import log, metrics
+
+# inotify(7) constants, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x08
+IN_MOVED_TO = 0x80
+IN_Q_OVERFLOW = 0x4000
+EVENT = struct.Struct('iIII')  # wd, mask, cookie, len; then the name
+
+
+def inotify(directory):
+    '''
+    A non-blocking inotify descriptor that reports files in directory that
+    were closed after writing or moved into it, or None where inotify is
+    not available (not linux, no libc, or out of watches).
+    '''
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory),
+                              IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def read_events(fd):
+    '''
+    names of the files in the events waiting on the inotify descriptor fd,
+    or None when the kernel queue overflowed and events were lost.
+    '''
+    names = set()
+    while True:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        i = 0
+        while i < len(data):
+            wd, mask, cookie, n = EVENT.unpack_from(data, i)
+            i += EVENT.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            names.add(os.fsdecode(data[i:i + n].rstrip(b'\0')))
+            i += n
+
+
+class Watcher:
+    '''
+    Finds the pages (and archives of pages, see archive.py) that appear or
+    change in directory, waiting with inotify where available and scanning
+    the directory every interval seconds otherwise. A browser writes a
+    saved page in several steps, so a file is only ready once its size and
+    mtime stayed the same for settle seconds; ready() then returns it once.
+    '''
+
+    def __init__(self, directory, settle=2.0, interval=5.0, poll=False):
+        self.directory = directory
+        self.settle = settle
+        self.interval = interval
+        self.fd = None if poll else inotify(directory)
+        self.seen = dict()     # {file: (size, mtime_ns)} when last ready
+        self.pending = dict()  # {file: ((size, mtime_ns), since)}
+
+    def stat(self, file):
+        try:
+            st = os.stat(os.path.join(self.directory, file))
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def scan(self):
+        '''
+        the source files in directory that are new or changed since seen.
+        '''
+        found = set()
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and archive.is_source(entry.name):
+                st = entry.stat()
+                if self.seen.get(entry.name) != (st.st_size, st.st_mtime_ns):
+                    found.add(entry.name)
+        return found
+
+    def wait(self):
+        '''
+        Waits for changes and returns the names that may have changed: the
+        names of the inotify events, or a directory scan when polling (and
+        when the inotify queue overflowed).
+        '''
+        timeout = self.settle if self.pending else self.interval
+        if self.fd is None:
+            time.sleep(timeout)
+            return self.scan()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        names = read_events(self.fd)
+        if names is None:
+            metrics.count('watch_overflow')
+            return self.scan()
+        return {n for n in names if archive.is_source(n)}
+
+    def ready(self, names):
+        '''
+        Adds names to the pending files and returns the sorted pending
+        files whose size and mtime did not change for settle seconds.
+        '''
+        now = time.monotonic()
+        for name in names:
+            st = self.stat(name)
+            if st is not None and st != self.seen.get(name) \
+                    and (name not in self.pending
+                         or self.pending[name][0] != st):
+                self.pending[name] = (st, now)
+        done = []
+        for name, (st, since) in list(self.pending.items()):
+            now_st = self.stat(name)
+            if now_st is None:
+                del self.pending[name]  # removed, eg: a browser temp file
+            elif now_st != st:
+                self.pending[name] = (now_st, now)
+            elif now - since >= self.settle:
+                del self.pending[name]
+                self.seen[name] = st
+                done.append(name)
+        return sorted(done)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def update(reader, directory, files, workers=None, rank_file=None):
+    '''
+    Ingests files (see ingest.scrape, which skips pages already scraped and
+    updates the running statistics and rollups from the new rows) and
+    writes the ranking, from the running statistics, to rank_file.
+    Returns {file: error}. An update costs O(new rows) plus O(funds) for
+    the ranking and the save of the rollups, and now and then the column
+    store is built again (see ingest.finish): it does not rewrite
+    groupByfund.json, which the next group_by_fund() brings up to date
+    from the rows appended since (see GroupCache). Rows dated on or before a fund's last day (a page saved
+    out of order) cost the fund's history: its running statistics are
+    computed again from group_by_fund().
+    '''
+    with metrics.stage('watch_update', files=len(files)):
+        failed = reader.scrape_files(directory, files, workers)
+        if rank_file and has_rows(reader):
+            reader.rank_funds(out=rank_file)
+    return failed
+
+
+def has_rows(reader):
+    '''
+    True when reader holds rows to rank: running statistics with the csv
+    backend (kept up to date by the ingest), fund groups with sqlite.
+    '''
+    if reader.backend == 'sqlite':
+        reader.group_by_fund()
+        return bool(reader.groupbyfund)
+    return os.path.exists(reader.csv_file) and bool(reader.update_stats())
+
+
+def watch(reader, directory, workers=None, rank_file=None, settle=2.0,
+          interval=5.0, poll=False, once=False, metrics_file=None):
+    '''
+    Runs until SIGINT or SIGTERM: ingests the pages already in directory
+    (only the new ones are parsed), then every page saved there as soon as
+    it is complete, and keeps rank_file up to date, see update().
+    once=True stops after the first update, eg: to test a cron setup.
+    The metrics of each update are appended to metrics_file, or dropped,
+    so a long running watch does not pile them up in memory.
+    '''
+    watcher = Watcher(directory, settle, interval, poll)
+    stop = []
+    old = signal.signal(signal.SIGTERM, lambda signum, frame: stop.append(1))
+    log.info(f'watching {directory} with '
+             f'{"polling" if watcher.fd is None else "inotify"}')
+    try:
+        files = sorted(watcher.scan())
+        watcher.seen.update((f, watcher.stat(f)) for f in files)
+        while True:
+            if files:
+                update(reader, directory, files, workers, rank_file)
+                if metrics_file:
+                    metrics.export(metrics_file)
+                else:
+                    metrics.reset()
+                if once:
+                    return
+            if stop:
+                return
+            files = watcher.ready(watcher.wait())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, old)
+        watcher.close()
+        log.info('watch stopped')